@@ -1,34 +1,39 @@
 from agents import *
 
 class QLearning(ISoccerGameAgent):
-    def __init__(self, env: SoccerEnviroment, gamma):
-        self.env = env
-        self.gamma = gamma
-        stateSpace = env.state_space
+    def __init__(self, env: SoccerEnviroment, gamma, sparse=False):
+        super().__init__(env, gamma, sparse)
+        numStates = env.state_space
         actSpace = env.action_space
-        dimOfQ = np.concatenate((stateSpace, [actSpace]))
-        self.Q = np.ones(dimOfQ)
+        self.Q = self.newTable((numStates, actSpace), 1.0)
+        # the best actions of a state are kept until its Q changes, see ArgmaxSampler
+        self.sampler = ArgmaxSampler(numStates, actSpace, lambda s: self.Q[s], sparse=sparse)
 
-    def act(self, s0, s1, s2):
-        s2 = int(s2)
-        Qvalues = self.Q[s0, s1, s2]
+    def act(self, s):
         # pick the best action, tie-break randomly
-        action = np.random.choice(np.flatnonzero(Qvalues == Qvalues.max()))
-        return action
+        return self.sampler.sample(s, self.rng.random())
 
-    def learn(self, alpha, s0, s1, s2, action, opponentAction, s_prime0, s_prime1, s_prime2, reward, opponent_reward,done):
-        s2 = int(s2)
-        s_prime2 = int(s_prime2)
+    def learn(self, alpha, s, action, opponentAction, s_prime, reward, opponent_reward, done):
         # step 4a. calculate V_prime for end state, next state value is 0
         if not done:
-            V_prime = np.max(self.Q[s_prime0, s_prime1, s_prime2])
+            V_prime = np.max(self.Q[s_prime])
         else:
             V_prime = 0
 
         # step 4b. update Q, which is the same as in FoeQ
         # Q[s,a] = (1-alpha) * Q[s,a] + alpha * ((1-gamma)*rew + gamma * V[s’])
         # simple Q learning does not consider opponent's actions
-        self.Q[s0, s1, s2, action] = \
-            (1 - alpha) * self.Q[s0, s1, s2, action] + \
+        self.Q[s, action] = \
+            (1 - alpha) * self.Q[s, action] + \
             alpha * ((1-self.gamma) * reward + self.gamma * V_prime)
-        pass
+        self.sampler.invalidate(s)
+
+    def actBatch(self, s):
+        return self.sampler.sampleMany(s, self.rng.randomMany(len(s)))
+
+    # same update as learn for a batch of games, V of s_prime is read before the batch is learned
+    # and updates of the same (s, a) are applied one after the other, see blendBatch
+    def learnBatch(self, alpha, s, action, opponentAction, s_prime, reward, opponent_reward, done):
+        V_prime = np.where(done, 0, np.max(self.Q[s_prime], axis=-1))
+        blendBatch(self.Q, (s, action), alpha, (1-self.gamma) * reward + self.gamma * V_prime)
+        self.sampler.invalidate(s)
@@ -0,0 +1,195 @@
+# AsyncTrainer trains an agent and an opponent with separate actor and learner processes
+# for FoeQ and CEQ playing is cheap but every learn call solves an LP, in SoccerGame.train one thread
+# does both, here the solves of different states run in parallel
+#
+# actors play games with local copies of both players and send the transitions
+# (s, agentAct, opponentAct, s_prime, reward, done, alpha) to the learners, in chunks through bounded queues,
+# an actor blocks when the learners fall behind
+# every state belongs to one learner (s % numLearners), which runs the unchanged learn of both players
+# on the transitions starting in its states, learn only writes the tables of state s, so the learners
+# never write the same rows, they read V[s_prime] of states of other learners as it currently is
+# the tables live in shared memory, the learners write them in place and the actors copy them
+# into their players every syncEvery episodes, this is how new policies reach the actors
+#
+# the episodes of a run are dealt round robin to the actors, alpha and epsilon of an episode follow
+# the schedule of SoccerGame.train for its index, every actor seeds its streams from the root seed
+# and its index, the order the learners see the transitions of different actors in is not fixed,
+# so unlike SoccerGame.train a run is not exactly reproducible
+import math
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
+import numpy as np
+from soccer import SoccerEnviroment
+from evaluation import jobSeed, makeAgent, makeField
+from parallel_runner import DEFAULT_PARAMS
+from random_streams import RandomStream
+
+TRANSITION_DTYPE = np.dtype([('s', np.int64), ('agentAct', np.int8), ('opponentAct', np.int8),
+                             ('s_prime', np.int64), ('reward', np.int16), ('done', bool), ('alpha', np.float64)])
+
+# the value of a schedule that starts at start and is multiplied by decay after every episode
+# as long as it is above minimum, see SoccerGame.train
+def decayed(start, decay, minimum, episode):
+    if start <= minimum or decay >= 1:
+        return start
+    lastDecay = math.ceil(math.log(minimum / start) / math.log(decay))
+    return start * decay ** min(episode, lastDecay)
+
+# copies the tables of the players into new shared memory blocks,
+# returns the blocks and a spec to attach them in another process, see attachTables
+def shareTables(players):
+    blocks = []
+    spec = []
+    for player in players:
+        tables = {}
+        for name, table in player.getTables().items():
+            table = np.asarray(table)
+            block = shared_memory.SharedMemory(create=True, size=max(table.nbytes, 1))
+            np.ndarray(table.shape, table.dtype, buffer=block.buf)[...] = table
+            blocks.append(block)
+            tables[name] = (block.name, table.dtype.str, table.shape)
+        spec.append(tables)
+    return blocks, spec
+
+# returns the blocks and the tables of every player as views of them, the views are only valid
+# while the blocks are referenced, blocks are the blocks this process already has open
+def attachTables(spec, blocks=()):
+    blocks = {block.name: block for block in blocks}
+    players = []
+    for tables in spec:
+        arrays = {}
+        for name, (blockName, dtype, shape) in tables.items():
+            block = blocks.get(blockName) or shared_memory.SharedMemory(name=blockName)
+            blocks[blockName] = block
+            arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+        players.append(arrays)
+    return list(blocks.values()), players
+
+def runActor(index, numActors, job, spec, queues, results, seed, syncEvery, chunkSize):
+    params = dict(DEFAULT_PARAMS, **job.get('params', {}))
+    env = SoccerEnviroment(field=makeField(params['field']))
+    players = [makeAgent(job['agent'], env, params['gamma'], job.get('agentArgs')) for i in range(2)]
+    rng, env.rng, players[0].rng, players[1].rng = RandomStream(seed).spawn(4)
+    blocks, shared = attachTables(spec)
+    numLearners = len(queues)
+    chunks = [[] for i in range(numLearners)]
+
+    def pull():
+        for player, tables in zip(players, shared):
+            player.setTables({name: table.copy() for name, table in tables.items()})
+
+    def send(learner):
+        queues[learner].put(np.array(chunks[learner], dtype=TRANSITION_DTYPE))
+        chunks[learner] = []
+
+    def choose(player, s, epsilon):
+        if rng.random() < epsilon:
+            return rng.integers(env.action_space)
+        return player.act(s)
+
+    numSteps = 0
+    wins = 0
+    for n, episode in enumerate(range(index, params['numEpisode'], numActors)):
+        if n % syncEvery == 0:
+            pull()
+        alpha = decayed(params['alpha_start'], params['alpha_decay'], params['alpha_min'], episode)
+        epsilon = decayed(params['epsilon_start'], params['epsilon_decay'], params['epsilon_min'], episode)
+        s = env.reset()
+        step = 0
+        while True:
+            agentAct = choose(players[0], s, epsilon)
+            opponentAct = choose(players[1], s, epsilon)
+            s_prime, reward, done = env.step(agentAct, opponentAct)
+            learner = s % numLearners
+            chunks[learner].append((s, agentAct, opponentAct, s_prime, reward, done, alpha))
+            if len(chunks[learner]) >= chunkSize:
+                send(learner)
+            numSteps += 1
+            if done or step > params['maxStep']:
+                break
+            s = s_prime
+            step += 1
+        wins += reward > 0
+    for learner in range(numLearners):
+        if chunks[learner]:
+            send(learner)
+        queues[learner].put(None)
+    results.put(('actor', index, numSteps, wins))
+
+def runLearner(index, numActors, job, spec, transitions, results):
+    params = dict(DEFAULT_PARAMS, **job.get('params', {}))
+    env = SoccerEnviroment(field=makeField(params['field']))
+    blocks, shared = attachTables(spec)
+    agent, opponent = [makeAgent(job['agent'], env, params['gamma'], job.get('agentArgs'), tables)
+                       for tables in shared]
+    finishedActors = 0
+    numLearned = 0
+    while finishedActors < numActors:
+        chunk = transitions.get()
+        if chunk is None:
+            finishedActors += 1
+            continue
+        for s, agentAct, opponentAct, s_prime, reward, done, alpha in chunk.tolist():
+            agent.learn(alpha, s, agentAct, opponentAct, s_prime, reward, -reward, done)
+            opponent.learn(alpha, s, opponentAct, agentAct, s_prime, -reward, reward, done)
+        numLearned += len(chunk)
+    results.put(('learner', index, numLearned))
+
+class AsyncTrainer:
+    # numLearners=None uses one learner per cpu
+    # queueSize is the number of chunks of chunkSize transitions a learner queue holds
+    def __init__(self, numActors=1, numLearners=None, seed=0, queueSize=16, chunkSize=64, syncEvery=10):
+        self.numActors = numActors
+        self.numLearners = numLearners or multiprocessing.cpu_count()
+        self.seed = seed
+        self.queueSize = queueSize
+        self.chunkSize = chunkSize
+        self.syncEvery = syncEvery
+
+    # job is a training job as for ParallelRunner, returns the trained agent and opponent
+    # and stats, the steps played by each actor, the games the agent won and the transitions each learner learned
+    def train(self, job):
+        params = dict(DEFAULT_PARAMS, **job.get('params', {}))
+        env = SoccerEnviroment(field=makeField(params['field']))
+        players = [makeAgent(job['agent'], env, params['gamma'], job.get('agentArgs')) for i in range(2)]
+        blocks, spec = shareTables(players)
+        context = multiprocessing.get_context()
+        queues = [context.Queue(self.queueSize) for i in range(self.numLearners)]
+        results = context.Queue()
+        processes = [context.Process(target=runLearner, args=(i, self.numActors, job, spec, queues[i], results))
+                     for i in range(self.numLearners)]
+        processes += [context.Process(target=runActor,
+                                      args=(i, self.numActors, job, spec, queues, results,
+                                            jobSeed(self.seed, "actor#{}".format(i)), self.syncEvery, self.chunkSize))
+                      for i in range(self.numActors)]
+        stats = {'actorSteps': [0] * self.numActors, 'wins': 0, 'learned': [0] * self.numLearners}
+        try:
+            for process in processes:
+                process.start()
+            # a process that dies never reports, so check on them while waiting
+            for i in range(len(processes)):
+                while True:
+                    try:
+                        result = results.get(timeout=1)
+                        break
+                    except queue.Empty:
+                        if any(process.exitcode not in (None, 0) for process in processes):
+                            raise RuntimeError("an actor or learner process failed")
+                if result[0] == 'actor':
+                    stats['actorSteps'][result[1]] = result[2]
+                    stats['wins'] += result[3]
+                else:
+                    stats['learned'][result[1]] = result[2]
+            for process in processes:
+                process.join()
+            for player, tables in zip(players, attachTables(spec, blocks)[1]):
+                player.setTables({name: table.copy() for name, table in tables.items()})
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for block in blocks:
+                block.close()
+                block.unlink()
+        return players[0], players[1], stats
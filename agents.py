@@ -1,19 +1,375 @@
-import copy
+import sys
 import numpy as np
-from cvxopt import matrix, solvers
 from soccer import SoccerEnviroment
+from checkpoint import saveArrays, loadArrays
+from random_streams import RandomStream
+from state_tables import LazyStateTable
 from abc import ABC, abstractmethod
 
+# all tables of all agents are indexed by the state id first (see soccer.encodeState)
+# and hold this dtype, e.g. Q[s, action, opponentAction], pi[s, action] and V[s]
+TABLE_DTYPE = np.float64
+
 # this is the interface for all agents
+# every agent draws its random numbers from its own RandomStream self.rng
+# with sparse=True the tables of the agent are LazyStateTables that only allocate the visited states,
+# see state_tables.py, the agents read and write them the same way as the dense tables
 class ISoccerGameAgent(ABC):
-    def __init__(self, env: SoccerEnviroment, gamma):
+    # names of the tables an agent can learn, each agent only has the ones it uses
+    TABLES = ('Q', 'V', 'pi', 'opponentQ', 'opponentV')
+
+    def __init__(self, env: SoccerEnviroment, gamma, sparse=False):
         self.env = env
         self.gamma = gamma
+        self.sparse = sparse
+        self.rng = RandomStream()
+
+    # a table of shape (numStates, ...) where every entry starts as fill
+    def newTable(self, shape, fill):
+        if self.sparse:
+            return LazyStateTable(shape[0], shape[1:], fill, TABLE_DTYPE)
+        return np.full(shape, fill, dtype=TABLE_DTYPE)
+
+    # returns the learned tables by name, e.g. to send a trained agent to another process
+    def getTables(self):
+        return {name: getattr(self, name) for name in self.TABLES if hasattr(self, name)}
+
+    # the tables are indexed by state id first, as getTables returns them
+    # the cached distributions of the agent's sampler are dropped, they belong to the old tables
+    def setTables(self, tables):
+        for name, table in tables.items():
+            setattr(self, name, table)
+        if getattr(self, 'sampler', None) is not None:
+            self.sampler.invalidate()
+
+    # arrays besides the tables that learning depends on, e.g. the caches of a lazy agent, which a training
+    # checkpoint saves and restores so a resumed run goes on exactly where it stopped (see SoccerGame.train)
+    def getState(self):
+        return {}
+
+    def setState(self, state):
+        pass
+
+    # save the learned tables to a checkpoint file, see checkpoint.py
+    def save(self, path):
+        saveArrays(path, self.getTables(), {'agent': type(self).__name__})
+
+    # with mmap=True the tables are read only views of the file, which is enough to act
+    # and lets many processes share one copy, an agent loaded this way cannot learn
+    # (a lazy agent acts on the loaded policy without solving, see EquilibriumAgent.setTables)
+    def load(self, path, mmap=False):
+        tables, meta = loadArrays(path, mmap)
+        if meta.get('agent') != type(self).__name__:
+            raise ValueError("{} holds a {} agent, not {}".format(path, meta.get('agent'), type(self).__name__))
+        self.setTables(tables)
     
+    # s and s_prime are state ids
+    @abstractmethod
+    def act(self, s):
+        pass
+
+    @abstractmethod
+    def learn(self, alpha, s, action, opponentAction, s_prime, reward, opponent_reward, done):
+        pass
+
+    # batched versions of act and learn, every argument is an array with one entry per game
+    # agents with vectorized updates override these, the default plays the games one by one
+    def actBatch(self, s):
+        return np.array([self.act(s[i]) for i in range(len(s))], dtype=int)
+
+    def learnBatch(self, alpha, s, action, opponentAction, s_prime, reward, opponent_reward, done):
+        for i in range(len(s)):
+            self.learn(alpha, s[i], action[i], opponentAction[i], s_prime[i], reward[i], opponent_reward[i], done[i])
+
+# table[index] = (1 - alpha) * table[index] + alpha * target for a batch, index is a tuple of index arrays
+# the first update of every entry is scattered with fancy indexing, an entry the batch updates again
+# (e.g. two games in the same state taking the same actions) gets its later updates one by one in batch order,
+# so every update counts as if the batch was learned game by game
+def blendBatch(table, index, alpha, target):
+    keys = np.ravel_multi_index(index, table.shape[:len(index)])
+    first = np.unique(keys, return_index=True)[1]
+    head = tuple(i[first] for i in index)
+    table[head] = (1 - alpha) * table[head] + alpha * target[first]
+    if len(first) == len(keys):
+        return
+    repeated = np.ones(len(keys), dtype=bool)
+    repeated[first] = False
+    for i in np.flatnonzero(repeated):
+        entry = tuple(int(j[i]) for j in index)
+        table[entry] = (1 - alpha) * table[entry] + alpha * target[i]
+
+
+# samplers turn an agent's tables into actions without recomputing anything per call
+# they cache what they derive from the tables per state, the agent calls invalidate(s) whenever it
+# writes the tables of state s (invalidate() drops everything), and the cache is rebuilt on the next sample
+# sample(s, rand) picks the action of one state from the uniform random number rand,
+# sampleMany(states, rand) picks the actions of many states from a pre-drawn block of random numbers
+# both follow the same rule, so sampleMany(states, rand)[i] == sample(states[i], rand[i])
+# with sparse=True, like the tables of a sparse agent, the caches only hold the states that were sampled:
+# the python lists are kept in a dict and the arrays with a row per state are LazyStateTables,
+# only validArray stays dense, a byte per state is less than the index of a LazyStateTable
+class _StateCache:
+    def __init__(self, numStates, numActions, sparse=False):
+        self.numStates = numStates
+        self.numActions = numActions
+        self.sparse = sparse
+        # scalar sampling reads python lists, bulk sampling numpy arrays, each is rebuilt on its own
+        self.lists = self.__newLists()
+        self.validArray = np.zeros(numStates, dtype=bool)
+
+    def __newLists(self):
+        return _SparseLists() if self.sparse else [None] * self.numStates
+
+    # an array with a row of shape blockShape per state for bulk sampling
+    def newArray(self, blockShape, dtype):
+        if self.sparse:
+            return LazyStateTable(self.numStates, blockShape, 0, dtype)
+        return np.zeros((self.numStates,) + tuple(blockShape), dtype=dtype)
+
+    # bytes the caches use, the python lists by sys.getsizeof
+    @property
+    def nbytes(self):
+        lists = self.lists.values() if self.sparse else self.lists
+        size = sys.getsizeof(self.lists) + sum(sys.getsizeof(cached) for cached in lists if cached is not None)
+        return size + self.validArray.nbytes + sum(int(array.nbytes) for array in self.arrays())
+
+    def invalidate(self, s=None):
+        if s is None:
+            self.lists = self.__newLists()
+            self.validArray[:] = False
+            return
+        if np.ndim(s) == 0:
+            self.lists[s] = None
+        else:
+            for state in np.unique(s):
+                self.lists[state] = None
+        self.validArray[s] = False
+
+    # the states of a batch whose arrays must be rebuilt, each once
+    def staleStates(self, states):
+        return np.unique(states[~self.validArray[states]])
+
+# the lists of a sparse _StateCache, a state without an entry has no cached list
+class _SparseLists(dict):
+    def __missing__(self, s):
+        return None
+
+# picks uniformly among the actions with the largest value
+# values(s) returns the action values of a state, or of an array of states
+class ArgmaxSampler(_StateCache):
+    def __init__(self, numStates, numActions, values, sparse=False):
+        super().__init__(numStates, numActions, sparse)
+        self.values = values
+        self.ties = self.newArray((numActions,), bool)
+        self.numTies = self.newArray((), int)
+
+    def arrays(self):
+        return (self.ties, self.numTies)
+
+    def sample(self, s, rand):
+        ties = self.lists[s]
+        if ties is None:
+            values = self.values(s)
+            ties = self.lists[s] = np.flatnonzero(values == values.max()).tolist()
+        return ties[int(rand * len(ties))]
+
+    def sampleMany(self, states, rand):
+        stale = self.staleStates(states)
+        if len(stale):
+            values = self.values(stale)
+            self.ties[stale] = values == values.max(axis=-1, keepdims=True)
+            self.numTies[stale] = np.count_nonzero(self.ties[stale], axis=-1)
+            self.validArray[stale] = True
+        # the k-th of the tied actions, counted from 0
+        k = (rand * self.numTies[states]).astype(int)
+        return np.argmax(np.cumsum(self.ties[states], axis=-1) > k[:, None], axis=-1)
+
+# samples from a mixed policy, probs(s) returns the action probabilities of a state or an array of states
+# the action is the first whose cumulative probability exceeds rand, or the last one
+class MixedSampler(_StateCache):
+    def __init__(self, numStates, numActions, probs, sparse=False):
+        super().__init__(numStates, numActions, sparse)
+        self.probs = probs
+        self.cdf = self.newArray((numActions,), np.float64)
+
+    def arrays(self):
+        return (self.cdf,)
+
+    def sample(self, s, rand):
+        cdf = self.lists[s]
+        if cdf is None:
+            cdf = self.lists[s] = np.cumsum(self.probs(s)).tolist()
+        for i in range(len(cdf)):
+            if rand < cdf[i]:
+                return i
+        return i
+
+    def sampleMany(self, states, rand):
+        stale = self.staleStates(states)
+        if len(stale):
+            self.cdf[stale] = np.cumsum(self.probs(stale), axis=-1)
+            self.validArray[stale] = True
+        below = rand[:, None] < self.cdf[states]
+        return np.where(below.any(axis=-1), np.argmax(below, axis=-1), self.numActions - 1)
+
+
+# PolicyCache lets FoeQ and CEQ skip re-solving the policy of a state whose game has not changed
+# it keeps the game matrices each state was last solved with, and whether Q was updated since then
+# a state needs a new solve only when it is dirty and one of its matrices moved more than tolerance
+# hits counts the solves that were skipped and misses the solves that were needed
+class PolicyCache:
+    # with sparse=True the matrices are kept in LazyStateTables, like the tables of a sparse agent
+    def __init__(self, numStates, gameShape, numMatrices=1, tolerance=0.0, sparse=False):
+        # nan never compares within tolerance, so every state is solved the first time
+        if sparse:
+            self.solvedWith = [LazyStateTable(numStates, gameShape, np.nan, TABLE_DTYPE) for i in range(numMatrices)]
+        else:
+            self.solvedWith = [np.full((numStates,) + tuple(gameShape), np.nan, dtype=TABLE_DTYPE)
+                               for i in range(numMatrices)]
+        self.dirty = np.ones(numStates, dtype=bool)
+        self.tolerance = tolerance
+        self.hits = 0
+        self.misses = 0
+
+    # the matrices are saved dense, a sparse cache only allocates the states that were solved when restored
+    def getState(self):
+        state = {'solvedWith{}'.format(i): np.asarray(solvedWith) for i, solvedWith in enumerate(self.solvedWith)}
+        state.update({'dirty': self.dirty.copy(), 'counts': np.array([self.hits, self.misses])})
+        return state
+
+    def setState(self, state):
+        for i, solvedWith in enumerate(self.solvedWith):
+            matrices = state['solvedWith{}'.format(i)]
+            if isinstance(solvedWith, LazyStateTable):
+                solvedWith = self.solvedWith[i] = LazyStateTable(len(matrices), matrices.shape[1:], np.nan, TABLE_DTYPE)
+                solved = np.flatnonzero(~np.all(np.isnan(matrices.reshape(len(matrices), -1)), axis=1))
+                if len(solved):
+                    solvedWith[solved] = matrices[solved]
+            else:
+                solvedWith[...] = matrices
+        self.dirty[...] = state['dirty']
+        self.hits, self.misses = (int(count) for count in state['counts'])
+
+    # bytes the cache uses, dirty stays dense like the validArray of the samplers
+    @property
+    def nbytes(self):
+        return self.dirty.nbytes + sum(int(solvedWith.nbytes) for solvedWith in self.solvedWith)
+
+    def markDirty(self, s):
+        self.dirty[s] = True
+
+    def needsSolve(self, s, *matrices):
+        if self.dirty[s]:
+            for solvedWith, m in zip(self.solvedWith, matrices):
+                if not np.all(np.abs(m - solvedWith[s]) <= self.tolerance):
+                    self.misses += 1
+                    return True
+        self.hits += 1
+        return False
+
+    def markSolved(self, s, *matrices):
+        for solvedWith, m in zip(self.solvedWith, matrices):
+            solvedWith[s] = m
+        self.dirty[s] = False
+
+
+# EquilibriumAgent is the base of the agents that solve a matrix game in every state for their policy (FoeQ and CEQ)
+# the game of state s is made of the tables in GAME_TABLES at s, updatePolicy(s) solves it and writes
+# pi and the values of state s, updatePolicies(states) does the same for an array of states with solveMany
+# with lazy=True the policy of a state is only re-solved when its game moved more than tolerance
+# since the last solve, see PolicyCache, and act solves the policy of the states it plays in
+class EquilibriumAgent(ISoccerGameAgent):
+    GAME_TABLES = ('Q',)
+
+    def __init__(self, env, gamma, lazy=False, tolerance=0.0, sparse=False):
+        super().__init__(env, gamma, sparse)
+        self.__solver = None
+        self.lazy = lazy
+        if lazy:
+            self.policyCache = PolicyCache(env.state_space, [env.action_space, env.action_space],
+                                           numMatrices=len(self.GAME_TABLES), tolerance=tolerance, sparse=sparse)
+
+    # the solver is built by the first solve, an agent that only acts (e.g. a loaded one) never needs it
+    @property
+    def solver(self):
+        if self.__solver is None:
+            self.__solver = self.makeSolver()
+        return self.__solver
+
+    @abstractmethod
+    def makeSolver(self):
+        pass
+
+    # the solver if it was built, without building it
+    def builtSolver(self):
+        return self.__solver
+
     @abstractmethod
-    def act(self, s0, s1, s2):
+    def updatePolicy(self, s):
         pass
 
     @abstractmethod
-    def learn(self, alpha, s0, s1, s2, action, opponentAction, s_prime0, s_prime1, s_prime2, reward, opponent_reward, done):
-        pass
\ No newline at end of file
+    def updatePolicies(self, states):
+        pass
+
+    # the policy cache of a lazy agent and the state of its solver (e.g. the warm starts of MinimaxLPSolver)
+    # a solver that was built when the state was saved is built again to restore it
+    def getState(self):
+        state = {}
+        if self.lazy:
+            state.update({'policyCache/' + name: array for name, array in self.policyCache.getState().items()})
+        if self.builtSolver() is not None and hasattr(self.builtSolver(), 'getState'):
+            state.update({'solver/' + name: array for name, array in self.builtSolver().getState().items()})
+        return state
+
+    def setState(self, state):
+        parts = {'policyCache': {}, 'solver': {}}
+        for name, array in state.items():
+            part, name = name.split('/', 1)
+            parts[part][name] = array
+        if self.lazy and parts['policyCache']:
+            self.policyCache.setState(parts['policyCache'])
+        if parts['solver']:
+            self.solver.setState(parts['solver'])
+
+    # the policy of loaded tables was solved from the loaded game, so in lazy mode every state counts as solved
+    # against it, and the agent acts on the policy it was given without building a solver
+    def setTables(self, tables):
+        super().setTables(tables)
+        if self.lazy and all(name in tables for name in self.GAME_TABLES):
+            self.policyCache.markSolved(np.arange(self.env.state_space),
+                                        *[np.asarray(tables[name]) for name in self.GAME_TABLES])
+
+    # the game matrices of state s
+    def game(self, s):
+        return [getattr(self, name)[s] for name in self.GAME_TABLES]
+
+    def act(self, s):
+        if self.lazy:
+            self.refreshPolicy(s)
+        return self.sampler.sample(s, self.rng.random())
+
+    def actBatch(self, s):
+        if self.lazy:
+            self.__refreshPolicies(np.unique(s))
+        return self.sampler.sampleMany(s, self.rng.randomMany(len(s)))
+
+    # re-solve the policy at a state, in lazy mode only if its game has moved
+    def refreshPolicy(self, s):
+        if self.lazy:
+            game = self.game(s)
+            if not self.policyCache.needsSolve(s, *game):
+                return
+            self.policyCache.markSolved(s, *game)
+        self.updatePolicy(s)
+
+    # lazy mode, re-solve the policies of the states whose games have moved,
+    # several at once with solveMany of the solver, see game_solvers.py
+    def __refreshPolicies(self, states):
+        stale = [s for s in states if self.policyCache.needsSolve(s, *self.game(s))]
+        for s in stale:
+            self.policyCache.markSolved(s, *self.game(s))
+        if len(stale) == 1:
+            self.updatePolicy(stale[0])
+        elif stale:
+            self.updatePolicies(np.array(stale))
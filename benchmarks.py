@@ -0,0 +1,238 @@
+# benchmark suite for the enviroment, the agents and their solvers
+#
+#   python benchmarks.py --output results.json
+#   python benchmarks.py --output new.json --baseline results.json
+#
+# every benchmark is seeded and replays the same pre-drawn states and actions, so two runs on the same
+# machine measure the same work, the best of --repeat runs is reported to reduce noise
+# results are written as json: {'meta': {...}, 'results': {name: {'value', 'unit', 'higherIsBetter'}}}
+# with --baseline every result is compared to the saved one and the exit code is 1 if any of them
+# got worse by more than --tolerance
+# --rows and --columns run everything on a larger field, to see how the agents scale with the state space
+# the startup group times a fresh evaluation worker, importing its entry point evaluation.playShard
+# and playing a first game, the exit code is also 1 if the import takes longer than --import-budget
+# or loads one of LAZY_MODULES, which only the components that use them may import
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from time import perf_counter
+import numpy as np
+from soccer import SoccerEnviroment, BatchSoccerEnviroment, SoccerField
+from randomAgent import randomPlayAgent
+from QlearningAgent import QLearning
+from foeQ import FoeQ
+from friendQ import FriendQ
+from ceQ import CEQ
+from game_interface import SoccerGame
+from game_solvers import MinimaxLPSolver, MinimaxSimplexSolver, CELPSolver
+
+SEED = 0
+GAMMA = 0.99
+LAZY_MODULES = ('cvxopt', 'matplotlib')
+# seconds
+WORKER_IMPORT_BUDGET = 0.5
+
+# runs in a new interpreter, like a spawned worker process
+STARTUP_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import evaluation
+imported = time.perf_counter()
+evaluation.playShard(('FoeQ', None, None), ('CEQ', None, None), 1, 0.99, 500, 0, {field})
+played = time.perf_counter()
+print(json.dumps({{'import': imported - start, 'firstGame': played - imported,
+                  'modules': [name for name in {lazyModules} if name in sys.modules]}}))
+'''
+
+# best time of repeat runs of fn, which does number operations per run
+def bestTime(fn, number, repeat):
+    best = np.inf
+    for i in range(repeat):
+        start = perf_counter()
+        fn()
+        best = min(best, perf_counter() - start)
+    return best / number
+
+def latency(seconds):
+    return {'value': seconds * 1e6, 'unit': 'us/call', 'higherIsBetter': False}
+
+def throughput(seconds):
+    return {'value': 1 / seconds, 'unit': 'ops/s', 'higherIsBetter': True}
+
+# random playable transitions (s, a, o, s', r, done) drawn from the transition table
+def sampleTransitions(num, field):
+    rng = np.random.RandomState(SEED)
+    env = SoccerEnviroment(field=field)
+    table = env.getTransitionTable()
+    states = []
+    for posOfA in field.spawn:
+        for posOfB in field.spawn:
+            if posOfA != posOfB:
+                states += [field.encodeState(posOfA, posOfB, False), field.encodeState(posOfA, posOfB, True)]
+    transitions = []
+    for i in range(num):
+        s = states[rng.randint(len(states))]
+        a, o, order = rng.randint(env.action_space), rng.randint(env.action_space), rng.randint(2)
+        key = (s, a, o, order)
+        s_prime = int(table.nextState[key])
+        reward = int(table.reward[key])
+        transitions.append((s, a, o, s_prime, reward, reward != 0))
+    return transitions
+
+def benchEnviroment(results, number, repeat, field):
+    for name, useTable in (('env.step', False), ('env.step.table', True)):
+        np.random.seed(SEED)
+        env = SoccerEnviroment(useTable, field=field)
+        actions = np.random.randint(env.action_space, size=(number, 2)).tolist()
+        def run():
+            env.reset()
+            for a, o in actions:
+                s, reward, done = env.step(a, o)
+                if done:
+                    env.reset()
+        results[name] = throughput(bestTime(run, number, repeat))
+    numGames = 1024
+    np.random.seed(SEED)
+    env = BatchSoccerEnviroment(numGames, field=field)
+    env.reset()
+    actions = np.random.randint(env.action_space, size=(max(number // numGames, 10), 2, numGames))
+    def runBatch():
+        for a, o in actions:
+            env.step(a, o)
+    results['env.step.batch{}'.format(numGames)] = throughput(bestTime(runBatch, len(actions) * numGames, repeat))
+
+def benchAgents(results, number, repeat, field):
+    agents = {'randomPlayAgent': randomPlayAgent, 'QLearning': QLearning, 'FriendQ': FriendQ,
+              'FoeQ': FoeQ, 'FoeQ.simplex': lambda env, gamma: FoeQ(env, gamma, backend='simplex'), 'CEQ': CEQ}
+    transitions = sampleTransitions(number, field)
+    for name, make in agents.items():
+        np.random.seed(SEED)
+        # the LP agents are much slower, time fewer calls of them
+        calls = transitions if name in ('randomPlayAgent', 'QLearning', 'FriendQ', 'FoeQ.simplex') \
+            else transitions[:max(number // 20, 10)]
+        agent = make(SoccerEnviroment(field=field), GAMMA)
+        def act():
+            for s, a, o, s_prime, reward, done in calls:
+                agent.act(s)
+        def learn():
+            for s, a, o, s_prime, reward, done in calls:
+                agent.learn(0.1, s, a, o, s_prime, reward, -reward, done)
+        results[name + '.learn'] = latency(bestTime(learn, len(calls), repeat))
+        results[name + '.act'] = latency(bestTime(act, len(calls), repeat))
+
+def benchSolvers(results, number, repeat, field):
+    rng = np.random.RandomState(SEED)
+    num = max(number // 20, 10)
+    # games drift a little between solves of the same state, as they do during learning
+    games = np.cumsum(rng.normal(scale=0.05, size=(num, 5, 5)), axis=0) + rng.normal(size=(5, 5))
+    opponentGames = -games
+    for name, solver in (('solve.minimax.lp.cold', MinimaxLPSolver(5, warmStart=False)),
+                         ('solve.minimax.lp.warm', MinimaxLPSolver(5)),
+                         ('solve.minimax.simplex', MinimaxSimplexSolver(5))):
+        def run():
+            for game in games:
+                solver.solve(game, key=0)
+        results[name] = latency(bestTime(run, num, repeat))
+    solver = CELPSolver(5)
+    def runCE():
+        for game, opponentGame in zip(games, opponentGames):
+            solver.solve(game, opponentGame)
+    results['solve.ce.lp'] = latency(bestTime(runCE, num, repeat))
+
+def benchTraining(results, number, repeat, field):
+    for name, make, numEpisode in (('QLearning', QLearning, 200), ('FriendQ', FriendQ, 200),
+                                   ('FoeQ', FoeQ, 20), ('CEQ', CEQ, 20)):
+        def run():
+            np.random.seed(SEED)
+            env = SoccerEnviroment(field=field)
+            game = SoccerGame(numEpisode, 1, 0.99, 0.001, 1, 0.99, 0.01, GAMMA, env,
+                              make(env, GAMMA), make(env, GAMMA), seed=SEED)
+            game.train()
+        results['train.' + name] = throughput(bestTime(run, numEpisode, repeat))
+        results['train.' + name]['unit'] = 'episodes/s'
+
+def benchStartup(results, number, repeat, field):
+    script = STARTUP_SCRIPT.format(field={'rows': field.rows, 'columns': field.columns}, lazyModules=LAZY_MODULES)
+    # the worker imports the modules of this repository, so it runs next to them wherever it is started from
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    runs = [json.loads(subprocess.run([sys.executable, '-c', script], check=True, capture_output=True,
+                                      text=True, cwd=cwd).stdout.splitlines()[-1]) for i in range(repeat)]
+    results['startup.import'] = latency(min(run['import'] for run in runs))
+    results['startup.import']['modules'] = sorted(set(sum((run['modules'] for run in runs), [])))
+    results['startup.firstGame'] = latency(min(run['firstGame'] for run in runs))
+
+# the problems of the startup results, an import over budget or a lazy module that was loaded
+def checkStartup(results, budget):
+    if 'startup.import' not in results:
+        return []
+    problems = ["import of the worker loads {}".format(name) for name in results['startup.import']['modules']]
+    if results['startup.import']['value'] > budget * 1e6:
+        problems.append("import of the worker takes {:.3f}s, the budget is {:.3f}s".format(
+            results['startup.import']['value'] / 1e6, budget))
+    return problems
+
+BENCHMARKS = {'env': benchEnviroment, 'agents': benchAgents, 'solvers': benchSolvers, 'train': benchTraining,
+              'startup': benchStartup}
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print("{:<28}{:>14}{:>14}{:>9}".format('benchmark', 'baseline', 'now', 'change'))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]['value'], result['value']
+        # change > 0 is always an improvement
+        change = new / old - 1 if result['higherIsBetter'] else old / new - 1
+        flag = ''
+        if change < -tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print("{:<28}{:>14.2f}{:>14.2f}{:>+8.1%}{}".format(name, old, new, change, flag))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmarks for the soccer game')
+    parser.add_argument('--output', help='write the results to this json file')
+    parser.add_argument('--baseline', help='compare the results to this json file')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed slowdown before a result is a regression')
+    parser.add_argument('--only', nargs='*', choices=list(BENCHMARKS), help='run only these groups')
+    parser.add_argument('--number', type=int, default=2000, help='operations per timed run')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per benchmark, the best is kept')
+    parser.add_argument('--rows', type=int, default=2, help='rows of the field')
+    parser.add_argument('--columns', type=int, default=4, help='columns of the field')
+    parser.add_argument('--import-budget', type=float, default=WORKER_IMPORT_BUDGET,
+                        help='seconds an evaluation worker may take to import')
+    args = parser.parse_args(argv)
+
+    field = SoccerField(args.rows, args.columns)
+    results = {}
+    for group in args.only or BENCHMARKS:
+        BENCHMARKS[group](results, args.number, args.repeat, field)
+    for name, result in results.items():
+        print("{:<28}{:>14.2f} {}".format(name, result['value'], result['unit']))
+    if args.output:
+        meta = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+                'platform': platform.platform(), 'seed': SEED, 'number': args.number, 'repeat': args.repeat,
+                'field': [args.rows, args.columns],
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        with open(args.output, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+    status = 0
+    for problem in checkStartup(results, args.import_budget):
+        print(problem)
+        status = 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("{} regression(s): {}".format(len(regressions), ', '.join(regressions)))
+            status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
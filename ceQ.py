@@ -1,38 +1,42 @@
 from agents import *
+from game_solvers import CELPSolver
 
 # CEQ see Greenwald, Hall, and Zinkevich 2005
 # this algorithm is similar to FoeQ but different in calculating pi
-class CEQ(ISoccerGameAgent):
-    def __init__(self, env, gamma):
-        super().__init__(env, gamma)
-        stateSpace = env.state_space
+# the game of a state is Q[s] and opponentQ[s], see EquilibriumAgent for lazy
+class CEQ(EquilibriumAgent):
+    GAME_TABLES = ('Q', 'opponentQ')
+
+    def __init__(self, env, gamma, lazy=False, tolerance=0.0, sparse=False):
+        super().__init__(env, gamma, lazy, tolerance, sparse)
+        numStates = env.state_space
         actSpace = env.action_space
-        dimOfQ = np.concatenate((stateSpace, [actSpace, actSpace]))
-        self.Q = np.ones(dimOfQ)
-        self.V = np.ones(stateSpace)
+        dimOfQ = (numStates, actSpace, actSpace)
+        self.Q = self.newTable(dimOfQ, 1.0)
+        self.V = self.newTable((numStates,), 1.0)
         # different from FoeQ, calculate prob for each agent-opponent action pair
-        self.pi = np.ones(dimOfQ) / (actSpace**2)
+        self.pi = self.newTable(dimOfQ, 1.0 / (actSpace**2))
         # also different from FoeQ becaues CEQ is a joint distribution, we need to simulate the opponent's utilities too
-        self.opponentQ = np.ones(dimOfQ)
-        self.opponentV = np.ones(stateSpace)
-        solvers.options['show_progress'] = False
+        self.opponentQ = self.newTable(dimOfQ, 1.0)
+        self.opponentV = self.newTable((numStates,), 1.0)
+        # the agent acts on the marginal of the joint policy, which is kept with its cumulative sum
+        # until pi of the state is solved again, see MixedSampler
+        self.sampler = MixedSampler(numStates, actSpace, lambda s: np.sum(self.pi[s], axis=-1), sparse=sparse)
 
-    def act(self, s0, s1, s2):
-        s2 = int(s2)
-        actProb = np.sum(self.pi[s0, s1, s2, :], axis=1)
-        rand = np.random.random()
-        prob = 0
-        for i in range(len(actProb)):
-            prob += actProb[i]
-            if rand < prob:
-                return i
-        return i
+    def makeSolver(self):
+        return CELPSolver(self.env.action_space)
 
-    # see Greenwald, Hall, and Zinkevich 2005 table 2
-    def learn(self, alpha, s0, s1, s2, action, opponentAction, s_prime0, s_prime1, s_prime2, reward, opponent_reward, done):
-        s2 = int(s2)
-        s_prime2 = int(s_prime2)
+    # updatePolicy for an array of states
+    def updatePolicies(self, states):
+        Q = self.Q[states]
+        opponentQ = self.opponentQ[states]
+        pi = self.solver.solveMany(Q, opponentQ)
+        self.pi[states] = pi
+        self.sampler.invalidate(states)
+        self.V[states] = np.sum(pi * Q, axis=(1, 2))
+        self.opponentV[states] = np.sum(pi * opponentQ, axis=(1, 2))
 
+    def updatePolicy(self, s):
         # step 3. update policy
         # given game matrix in current state
         #               A
@@ -77,94 +81,42 @@ class CEQ(ISoccerGameAgent):
         # this is the column order for lp
         # the index of pi(s,m,n) is therefore 5*m+n, see below
 
-        # construct linear functions
-        # set 1
-        numActions = self.env.action_space
-        numComActions = numActions**2       # number of combined actions
-        A = []
-        b = []
-        # first do A
-        for i in range(numActions):
-            for j in range(numActions):
-                if i == j:
-                    continue
-                equation = [0]*(numComActions)
-                for k in range(numActions):
-                    # given action i, no need for A to change to action j
-                    # for all k, sum(pi(s,i,k)[Q(s,i,k)-Q(s,j,k)])>=0
-                    # locate column position in lp matrix A
-                    index = numActions * i + k
-                    equation[index] = self.Q[s0, s1, s2, i, k] - \
-                        self.Q[s0, s1, s2, j, k]
-                A.append(equation)
-                b.append(0)
-        # next do B
-        for i in range(numActions):
-            for j in range(numActions):
-                if i == j:
-                    continue
-                equation = [0]*(numComActions)
-                for k in range(numActions):
-                    # given action i, no need for B to change to action j
-                    # for all k, sum(pi(s,k,i)[Qo(s,k,i)-Qo(s,k,j)])>=0
-                    # locate column position in lp matrix A
-                    index = numActions * k + i
-                    equation[index] = self.opponentQ[s0, s1, s2, k, i] - \
-                        self.opponentQ[s0, s1, s2, k, j]
-                A.append(equation)
-                b.append(0)
-
-        # set 2
-        A = np.array(A, dtype=float)
-        b = np.array(b, dtype=float)
-        I = np.zeros((numComActions, numComActions))
-        for i in range(numComActions):
-            I[i, i] = 1
-        A = np.vstack((A, I, [1]*numComActions, [-1]*numComActions))
-        b = np.concatenate((b, [0]*numComActions, [1, -1]))
-
-        # set 3
-        c = []
-        for i in range(numActions):
-            for j in range(numActions):
-                c.append(self.Q[s0, s1, s2, i, j]+self.opponentQ[s0, s1, s2, i, j])
-
-        # solve lp
-        A = matrix(A)
-        b = matrix(b)
-        c = matrix(c)
-        sol = solvers.lp(-c, -A, -b)
-        result = np.array(sol['x'])
-        result = np.reshape(result, (numActions, numActions))
+        # set 1, 2 and 3 are built by CEConstraintBuilder and solved by CELPSolver, see game_solvers.py
+        result = self.solver.solve(self.Q[s], self.opponentQ[s])
 
         # update pie
-        self.pi[s0, s1, s2] = result
+        self.pi[s] = result
+        self.sampler.invalidate(s)
 
         # step 4a. update V for both agent and opponent
         # note that only V is updated but not V' because Q' and pi' are not changed
         # and we are saving all V values
-        self.V[s0, s1, s2] = np.sum(
-            self.pi[s0, s1, s2] * self.Q[s0, s1, s2])
+        self.V[s] = np.sum(self.pi[s] * self.Q[s])
         
-        self.opponentV[s0, s1, s2] = np.sum(
-            self.pi[s0, s1, s2] * self.opponentQ[s0, s1, s2])
+        self.opponentV[s] = np.sum(self.pi[s] * self.opponentQ[s])
+
+    # see Greenwald, Hall, and Zinkevich 2005 table 2
+    def learn(self, alpha, s, action, opponentAction, s_prime, reward, opponent_reward, done):
+        # step 3 and 4a. update policy and V for both agent and opponent, see updatePolicy
+        self.refreshPolicy(s)
 
         # step 4b. update Q value (on policy) for both agent and opponent
         # Q[s,a,o] = (1-alpha) * Q[s,a,o] + alpha * ((1-gamma)*rew + gamma * V[s’])
         if not done:
-            self.Q[s0, s1, s2, action, opponentAction] = \
-                (1 - alpha) * self.Q[s0, s1, s2, action, opponentAction] + \
+            self.Q[s, action, opponentAction] = \
+                (1 - alpha) * self.Q[s, action, opponentAction] + \
                 alpha * ((1-self.gamma) * reward + self.gamma *
-                         self.V[s_prime0, s_prime1, s_prime2])
-            self.opponentQ[s0, s1, s2, action, opponentAction] = \
-                (1 - alpha) * self.opponentQ[s0, s1, s2, action, opponentAction] + \
+                         self.V[s_prime])
+            self.opponentQ[s, action, opponentAction] = \
+                (1 - alpha) * self.opponentQ[s, action, opponentAction] + \
                 alpha * ((1-self.gamma) * opponent_reward + self.gamma *
-                         self.opponentV[s_prime0, s_prime1, s_prime2])
+                         self.opponentV[s_prime])
         else:
-            self.Q[s0, s1, s2, action, opponentAction] = \
-                (1 - alpha) * self.Q[s0, s1, s2, action,
+            self.Q[s, action, opponentAction] = \
+                (1 - alpha) * self.Q[s, action,
                 opponentAction] + alpha * (1 - self.gamma) * reward
-            self.opponentQ[s0, s1, s2, action, opponentAction] = \
-                (1 - alpha) * self.opponentQ[s0, s1, s2, action, 
-                opponentAction] + alpha * (1 - self.gamma) * opponent_reward 
-        pass
+            self.opponentQ[s, action, opponentAction] = \
+                (1 - alpha) * self.opponentQ[s, action, 
+                opponentAction] + alpha * (1 - self.gamma) * opponent_reward
+        if self.lazy:
+            self.policyCache.markDirty(s)
@@ -0,0 +1,66 @@
+# a small versioned file format for named numpy arrays, used to save agents and training checkpoints
+#
+# the file is laid out as
+#   magic (8 bytes) | version (uint32) | header length (uint32) | header (json) | padding | arrays
+# the header holds a free form meta dict and the name, dtype, shape and offset of every array
+# arrays start at 64 byte aligned offsets, so they can be memory mapped straight from the file
+# and many evaluation processes can share one copy through the page cache
+#
+# files are written to a temporary name and renamed, so a crash never leaves a half written checkpoint
+import json
+import os
+import struct
+import numpy as np
+
+MAGIC = b'SOCCERQ\x00'
+FORMAT_VERSION = 1
+ALIGN = 64
+
+def _align(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+def saveArrays(path, arrays, meta=None):
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    entries = []
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        entries.append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+        offset += array.nbytes
+    header = json.dumps({'meta': meta or {}, 'arrays': entries}).encode()
+    dataStart = _align(len(MAGIC) + 8 + len(header))
+    tmpPath = path + '.tmp'
+    with open(tmpPath, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<II', FORMAT_VERSION, len(header)))
+        f.write(header)
+        for entry, array in zip(entries, arrays.values()):
+            f.seek(dataStart + entry['offset'])
+            f.write(array.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmpPath, path)
+
+# returns the arrays by name and the meta dict
+# with mmap=True the arrays are read only views of the file instead of copies in memory
+def loadArrays(path, mmap=False):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a checkpoint file".format(path))
+        version, headerLength = struct.unpack('<II', f.read(8))
+        if version > FORMAT_VERSION:
+            raise ValueError("{} has format version {}, this code reads up to {}".format(path, version, FORMAT_VERSION))
+        header = json.loads(f.read(headerLength).decode())
+    dataStart = _align(len(MAGIC) + 8 + headerLength)
+    arrays = {}
+    for entry in header['arrays']:
+        dtype = np.dtype(entry['dtype'])
+        shape = tuple(entry['shape'])
+        offset = dataStart + entry['offset']
+        if mmap and int(np.prod(shape)) > 0:
+            arrays[entry['name']] = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+        else:
+            arrays[entry['name']] = np.fromfile(path, dtype=dtype, count=int(np.prod(shape)),
+                                                offset=offset).reshape(shape)
+    header['meta']['version'] = version
+    return arrays, header['meta']
@@ -0,0 +1,136 @@
+# Evaluator estimates win rates by playing games in shards on a pool of worker processes
+# shards of all requested matchups are interleaved so the pool stays busy, and the win counts
+# of each matchup are streamed back in shard order
+# a matchup stops as soon as the confidence interval of its win rate is narrower than ciWidth
+# or maxGames were played, the remaining shards are cancelled
+# every shard seeds its game from the root seed, the matchup name and the shard index, and shards are
+# counted in order, so the result does not depend on the number of workers
+# a player is given as (agentType, agentArgs, tables or checkpoint path), see makeAgent
+# a field is given as the keyword arguments of SoccerField, None plays on the default field
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+import numpy as np
+from soccer import SoccerEnviroment, SoccerField
+from randomAgent import randomPlayAgent
+from QlearningAgent import QLearning
+from foeQ import FoeQ
+from friendQ import FriendQ
+from ceQ import CEQ
+from game_interface import SoccerGame
+
+AGENTS = {'QLearning': QLearning, 'FoeQ': FoeQ, 'FriendQ': FriendQ, 'CEQ': CEQ, 'Random': randomPlayAgent}
+
+# the root seed of a job, derived from the root seed of the run and the job name
+def jobSeed(rootSeed, name):
+    sequence = np.random.SeedSequence([rootSeed, zlib.crc32(name.encode())])
+    return int(sequence.generate_state(1)[0])
+
+def makeField(field):
+    return SoccerField(**field) if field else None
+
+# tables is either a dict of tables or the path of a saved agent, which is memory mapped
+# so all workers evaluating the same agent share one copy of it
+def makeAgent(agentType, env, gamma, agentArgs=None, tables=None):
+    agent = AGENTS[agentType](env, gamma, **(agentArgs or {}))
+    if isinstance(tables, str):
+        agent.load(tables, mmap=True)
+    elif tables is not None:
+        agent.setTables(tables)
+    return agent
+
+# Wilson score interval of a win rate
+def confidenceInterval(wins, games, confidence=0.95):
+    if games == 0:
+        return (0.0, 1.0)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    p = wins / games
+    center = (p + z * z / (2 * games)) / (1 + z * z / games)
+    halfWidth = z * np.sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / (1 + z * z / games)
+    return (center - halfWidth, center + halfWidth)
+
+# plays numGames games and returns how many the agent won
+def playShard(agent, opponent, numGames, gamma, maxStep, seed, field=None):
+    env = SoccerEnviroment(field=makeField(field))
+    agent = makeAgent(agent[0], env, gamma, agent[1], agent[2])
+    opponent = makeAgent(opponent[0], env, gamma, opponent[1], opponent[2])
+    game = SoccerGame(0, 0, 0, 0, 0, 0, 0, gamma, env, agent, opponent, maxStep, seed=seed)
+    wins = 0
+    for i in range(numGames):
+        wins += game.play(False) == 100
+    return wins
+
+class EvaluationResult:
+    def __init__(self, wins, numGames, confidence):
+        self.wins = wins
+        self.numGames = numGames
+        self.winRate = wins / numGames if numGames else 0.0
+        self.ci = confidenceInterval(wins, numGames, confidence)
+
+    def __repr__(self):
+        return "win rate={:.4f}, ci=({:.4f}, {:.4f}), games={}".format(
+            self.winRate, self.ci[0], self.ci[1], self.numGames)
+
+class Evaluator:
+    # numWorkers=None uses one worker per cpu
+    # ciWidth=None never stops early and always plays maxGames
+    def __init__(self, numWorkers=None, seed=0, shardSize=200, maxGames=10000, ciWidth=0.02,
+                 confidence=0.95, gamma=0.99, maxStep=500, field=None):
+        self.numWorkers = numWorkers
+        self.seed = seed
+        self.shardSize = shardSize
+        self.maxGames = maxGames
+        self.ciWidth = ciWidth
+        self.confidence = confidence
+        self.gamma = gamma
+        self.maxStep = maxStep
+        self.field = field
+
+    def __isSettled(self, wins, numGames):
+        if numGames >= self.maxGames:
+            return True
+        if self.ciWidth is None:
+            return False
+        low, high = confidenceInterval(wins, numGames, self.confidence)
+        return high - low <= self.ciWidth
+
+    # matchups maps a name to a pair of players (agent, opponent)
+    # returns a dict of name -> EvaluationResult
+    def evaluate(self, matchups):
+        numShards = -(-self.maxGames // self.shardSize)
+        # per matchup: shards submitted so far, futures in shard order, wins and games counted so far
+        submitted = {name: 0 for name in matchups}
+        pending = {name: deque() for name in matchups}
+        counts = {name: [0, 0] for name in matchups}
+        active = list(matchups)
+        inFlight = 2 * (self.numWorkers or os.cpu_count())
+        with ProcessPoolExecutor(self.numWorkers) as pool:
+            while active:
+                # keep the pool busy, round robin over the unsettled matchups
+                while sum(len(pending[name]) for name in active) < inFlight:
+                    candidates = [name for name in active if submitted[name] < numShards]
+                    if not candidates:
+                        break
+                    for name in candidates:
+                        index = submitted[name]
+                        numGames = min(self.shardSize, self.maxGames - index * self.shardSize)
+                        agent, opponent = matchups[name]
+                        pending[name].append(pool.submit(playShard, agent, opponent, numGames, self.gamma,
+                                                         self.maxStep, jobSeed(self.seed, "{}#{}".format(name, index)),
+                                                         self.field))
+                        submitted[name] += 1
+                # count the oldest shard of each matchup, in order
+                for name in list(active):
+                    if not pending[name]:
+                        continue
+                    future = pending[name].popleft()
+                    shardIndex = submitted[name] - len(pending[name]) - 1
+                    counts[name][0] += future.result()
+                    counts[name][1] += min(self.shardSize, self.maxGames - shardIndex * self.shardSize)
+                    if self.__isSettled(*counts[name]):
+                        for future in pending[name]:
+                            future.cancel()
+                        active.remove(name)
+        return {name: EvaluationResult(wins, numGames, self.confidence) for name, (wins, numGames) in counts.items()}
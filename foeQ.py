@@ -1,34 +1,38 @@
 from agents import *
+from game_solvers import MinimaxLPSolver, MinimaxSimplexSolver
 
 # FoeQ / minimaxQ is implemented according to Littman 1994
-class FoeQ(ISoccerGameAgent):
-    def __init__(self, env, gamma):
-        super().__init__(env, gamma)
-        stateSpace = env.state_space
+# the policy of a state is solved from the game Q[s], see EquilibriumAgent for lazy
+class FoeQ(EquilibriumAgent):
+    SOLVERS = {'cvxopt': MinimaxLPSolver, 'simplex': MinimaxSimplexSolver}
+
+    # backend picks the minimax solver, 'cvxopt' for the LP or 'simplex' for the small dense simplex
+    def __init__(self, env, gamma, lazy=False, tolerance=0.0, backend='cvxopt', sparse=False):
+        super().__init__(env, gamma, lazy, tolerance, sparse)
+        numStates = env.state_space
         actSpace = env.action_space
-        dimOfQ = np.concatenate((stateSpace, [actSpace, actSpace]))
-        dimOfPi = np.concatenate((stateSpace, [actSpace]))
-        self.Q = np.ones(dimOfQ)
-        self.V = np.ones(stateSpace)
-        self.pi = np.ones(dimOfPi) / actSpace
-        solvers.options['show_progress'] = False
+        self.Q = self.newTable((numStates, actSpace, actSpace), 1.0)
+        self.V = self.newTable((numStates,), 1.0)
+        self.pi = self.newTable((numStates, actSpace), 1.0 / actSpace)
+        # the minimax LP only changes in the game matrix, the solver keeps everything else allocated
+        # and warm starts each state from its previous solution
+        if backend not in self.SOLVERS:
+            raise ValueError("unknown FoeQ backend: {}".format(backend))
+        self.backend = backend
+        # the cumulative policy of a state is kept until its pi is solved again, see MixedSampler
+        self.sampler = MixedSampler(numStates, actSpace, lambda s: self.pi[s], sparse=sparse)
 
-    def act(self, s0, s1, s2):
-        s2 = int(s2)
-        actProb = self.pi[s0, s1, s2, :]
-        rand = np.random.random()
-        prob = 0
-        for i in range(len(actProb)):
-            prob += actProb[i]
-            if rand < prob:
-                return i
-        return i
+    def makeSolver(self):
+        return self.SOLVERS[self.backend](self.env.action_space)
 
-    # see Greenwald, Hall, and Zinkevich 2005 table 2
-    def learn(self, alpha, s0, s1, s2, action, opponentAction, s_prime0, s_prime1, s_prime2, reward, opponent_reward, done):
-        s2 = int(s2)
-        s_prime2 = int(s_prime2)
+    # updatePolicy for an array of states
+    def updatePolicies(self, states):
+        pi, V = self.solver.solveMany(np.swapaxes(self.Q[states], 1, 2), keys=states)
+        self.pi[states] = pi
+        self.sampler.invalidate(states)
+        self.V[states] = V
 
+    def updatePolicy(self, s):
         # step 3. update policy
         # given game matrix in current state
         #
@@ -56,44 +60,36 @@ class FoeQ(ISoccerGameAgent):
             # matrix changes according to the rewardss
         # here it is done using the same setup but the numbers come from the Q table
 
-        # first form game matrix       
-        gameMatrix = copy.copy(self.Q[s0, s1, s2].T)
-        # add constrains all probability >= 0
-        numActions = self.env.action_space
-        I = np.zeros((numActions, numActions))
-        for i in range(numActions):
-            I[i, i] = 1
-        gameMatrix = np.vstack((gameMatrix, I))
-        # add V to the matrix
-        gameMatrix = np.hstack(
-            (gameMatrix, [[-1], [-1], [-1], [-1], [-1], [0], [0], [0], [0], [0]]))
-        # add contraints that all probs sum to 1
-        gameMatrix = np.vstack(
-            (gameMatrix, [1, 1, 1, 1, 1, 0], [-1, -1, -1, -1, -1, 0]))
-        gameMatrix = matrix(gameMatrix)
-        b = matrix([0., 0., 0., 0., 0., 0., 0., 0., 0., 0., 1., -1.])
-        c = matrix([0., 0., 0., 0., 0., 1.])
-        # use negative sign to convert max to min
-        sol = solvers.lp(-c, -gameMatrix, -b)
-        result = np.array(sol['x'])
+        # see MinimaxLPSolver for how the constraints are laid out
+        # the solver adds the probability constraints and maximizes V
+        # (MinimaxSimplexSolver solves the same problem in its dual form)
+        gameMatrix = self.Q[s].T
+        pi, V = self.solver.solve(gameMatrix, key=s)
         # update pie
-        self.pi[s0, s1, s2] = copy.copy(result[0:5, 0])
+        self.pi[s] = pi
+        self.sampler.invalidate(s)
 
         # step 4a. update V
         # here V is the minimax value calculated by lp so no need to re-calculate
         # note that only V is updated but not V' because Q' and pi' are not changed
         # and we are saving all V values
-        self.V[s0, s1, s2] = result[5,0]
-    
+        self.V[s] = V
+
+    # see Greenwald, Hall, and Zinkevich 2005 table 2
+    def learn(self, alpha, s, action, opponentAction, s_prime, reward, opponent_reward, done):
+        # step 3 and 4a. update policy and V, see updatePolicy
+        self.refreshPolicy(s)
+
         # step 4b. update Q value (on policy)
         # Q[s,a,o] = (1-alpha) * Q[s,a,o] + alpha * ((1-gamma)*rew + gamma * V[s’])
         if not done:
-            self.Q[s0, s1, s2, action, opponentAction] = \
-                (1 - alpha) * self.Q[s0, s1, s2, action, opponentAction] + \
+            self.Q[s, action, opponentAction] = \
+                (1 - alpha) * self.Q[s, action, opponentAction] + \
                 alpha * ((1-self.gamma) * reward + self.gamma *
-                self.V[s_prime0, s_prime1, s_prime2])
+                self.V[s_prime])
         else:
-            self.Q[s0, s1, s2, action, opponentAction] = \
-                (1 - alpha) * self.Q[s0, s1, s2, action,
+            self.Q[s, action, opponentAction] = \
+                (1 - alpha) * self.Q[s, action,
                 opponentAction] + alpha * (1 - self.gamma) * reward
-        pass
\ No newline at end of file
+        if self.lazy:
+            self.policyCache.markDirty(s)
\ No newline at end of file
@@ -4,13 +4,14 @@ from agents import *
 # compared to FoeQ, we dont need to store pi and V because we can get both easily from the game matrix
 # V is the max value from the matrix and pi chooses the action having that value
 class FriendQ(ISoccerGameAgent):
-    def __init__(self, env, gamma):
-        super().__init__(env, gamma)
-        stateSpace = env.state_space
+    def __init__(self, env, gamma, sparse=False):
+        super().__init__(env, gamma, sparse)
+        numStates = env.state_space
         actSpace = env.action_space
-        dimOfQ = np.concatenate((stateSpace, [actSpace, actSpace]))
-        self.Q = np.ones(dimOfQ)
-
+        self.Q = self.newTable((numStates, actSpace, actSpace), 1.0)
+        # the best columns of the game matrix of a state are kept until its Q changes, see ArgmaxSampler
+        # the max of each column is the max over the opponent actions of Q[s, a]
+        self.sampler = ArgmaxSampler(numStates, actSpace, lambda s: np.amax(self.Q[s], axis=-1), sparse=sparse)
 
     # create game matrix at state s
         #               A
@@ -23,29 +24,22 @@ class FriendQ(ISoccerGameAgent):
         #
         # the values at each position is Q(s, A, B)
         # game matix is Q(s) transposed
-    def __constructGameMatrix(self, s0, s1, s2: int):
-        return self.Q[s0, s1, s2].T
+    def __constructGameMatrix(self, s):
+        return self.Q[s].T
     
-    def act(self, s0, s1, s2):
-        s2 = int(s2)
-        # get game matrix at current state
-        gameMatrix = self.__constructGameMatrix(s0, s1, s2)
-        # get max value of each column
-        columns = np.amax(gameMatrix, axis=0)
+    def act(self, s):
+        # get max value of each column of the game matrix at current state
         # pick the best action, tie-break randomly
         # random tie-breaking is essensial because it is equal to dividing the probability among best options
-        action = np.random.choice(np.flatnonzero(columns == columns.max()))
-        return action
+        return self.sampler.sample(s, self.rng.random())
     
     # see Greenwald, Hall, and Zinkevich 2005 table 2
-    def learn(self, alpha, s0, s1, s2, action, opponentAction, s_prime0, s_prime1, s_prime2, reward, opponent_reward,done):
-        s2 = int(s2)
-        s_prime2 = int(s_prime2)
+    def learn(self, alpha, s, action, opponentAction, s_prime, reward, opponent_reward, done):
         # step 4a. calculate V_prime which is max(B) max(A) in the game matrix littman FFQ paper equation 7
         # notice here we are making gameMatrix for next state s_prime
         # for end state, next state value is 0
         if not done:
-            gameMatrix = self.__constructGameMatrix(s_prime0, s_prime1, s_prime2)
+            gameMatrix = self.__constructGameMatrix(s_prime)
             V_prime = np.max(gameMatrix)
         else:
             V_prime = 0
@@ -53,7 +47,17 @@ class FriendQ(ISoccerGameAgent):
         # step 4b. update Q, which is the same as in FoeQ
         # Q[s,a,o] = (1-alpha) * Q[s,a,o] + alpha * ((1-gamma)*rew + gamma * V[s’])
         # except that V_prime is already calcuated here
-        self.Q[s0, s1, s2, action, opponentAction] = \
-            (1 - alpha) * self.Q[s0, s1, s2, action, opponentAction] + \
+        self.Q[s, action, opponentAction] = \
+            (1 - alpha) * self.Q[s, action, opponentAction] + \
             alpha * ((1-self.gamma) * reward + self.gamma * V_prime)
-        pass
+        self.sampler.invalidate(s)
+
+    def actBatch(self, s):
+        return self.sampler.sampleMany(s, self.rng.randomMany(len(s)))
+
+    # same update as learn for a batch of games, V of s_prime is read before the batch is learned
+    # and updates of the same (s, a, o) are applied one after the other, see blendBatch
+    def learnBatch(self, alpha, s, action, opponentAction, s_prime, reward, opponent_reward, done):
+        V_prime = np.where(done, 0, np.max(self.Q[s_prime], axis=(1, 2)))
+        blendBatch(self.Q, (s, action, opponentAction), alpha, (1-self.gamma) * reward + self.gamma * V_prime)
+        self.sampler.invalidate(s)
@@ -1,5 +1,9 @@
-from collections import deque
+import os
 import numpy as np
+from checkpoint import saveArrays, loadArrays
+from metrics import MetricsSink, ErrorCurve, ProgressPrinter
+from random_streams import RandomStream, seedComponents
+from soccer import BatchSoccerEnviroment
 
 
 # this class is where the game is actually played
@@ -9,7 +13,14 @@ import numpy as np
 # and they learn and behave independent of each other
 # the learning parameters are provided and are the same for both players
 class SoccerGame:
-    def __init__(self, numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, agent, opponent, maxStep=500):
+    # profiler: an optional Profiler that times train, trainBatch and evaluate, see profiling.py
+    # metrics: an optional MetricsSink that gets a record of every training episode, see metrics.py
+    # without one, training keeps the error curve it returns and prints its progress every 1000 episodes
+    # seed: the root seed of the game, the enviroment, the agent and the opponent each get their own
+    # stream spawned from it (see random_streams.py), without it they keep the streams they have
+    # replay: an optional PrioritizedReplay that train learns through, which also replays
+    # the transitions seen so far between steps, see replay.py, its stream is spawned after the others
+    def __init__(self, numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, agent, opponent, maxStep=500, profiler=None, metrics=None, seed=None, replay=None):
         self.alpha_start = alpha_start
         self.alpha_decay = alpha_decay
         self.alpha_min = alpha_min
@@ -22,59 +33,198 @@ class SoccerGame:
         self.agent = agent
         self.opponent = opponent
         self.maxStep = maxStep
+        self.profiler = profiler
+        self.metrics = metrics
+        self.replay = replay
+        # the start state the error curve samples Q at, A on cell 2, B on cell 1 with the ball
+        self.sampleState = env.field.encodeState(2, 1, False)
+        self.rng = RandomStream()
+        if seed is not None:
+            seedComponents(seed, self, env, agent, opponent, *([replay] if replay is not None else []))
 
     # sample a fixed point in agent's Q function space
     # by default the start position
-    def __sampleAgentQValue(self, s0=2, s1=1, s2=0, a=1, o=4):
+    def __sampleAgentQValue(self, a=1, o=4):
+        s = self.sampleState
         # special case for Q learning
-        if len(self.agent.Q.shape)<5:
-            return self.agent.Q[s0,s1,s2,a]
-        return self.agent.Q[s0,s1,s2,a,o]
+        if len(self.agent.Q.shape)<3:
+            return self.agent.Q[s,a]
+        return self.agent.Q[s,a,o]
+
+    # whether a player explores instead of acting on its policy
+    def __explore(self, epsilon):
+        return self.rng.random() < epsilon
+
+    def __metricsSink(self):
+        if self.metrics is not None:
+            return self.metrics
+        return MetricsSink([ErrorCurve(), ProgressPrinter(self.numEpisode)])
+
+    # a training checkpoint holds the tables of both players, the rest of their state that learning depends on
+    # (see ISoccerGameAgent.getState), the progress of training, the state of the metrics consumers
+    # and the random streams of the game, the enviroment and both players,
+    # so a resumed run continues exactly where it stopped
+    def __saveCheckpoint(self, path, episode, alpha, epsilon, sink):
+        sink.flush()
+        arrays = dict(sink.getState())
+        for role, player in (('agent', self.agent), ('opponent', self.opponent)):
+            for name, table in player.getTables().items():
+                arrays[role + '/' + name] = table
+            for name, array in player.getState().items():
+                arrays[role + '.state/' + name] = array
+        saveArrays(path, arrays, {'episode': episode, 'alpha': alpha, 'epsilon': epsilon,
+                                  'agent': type(self.agent).__name__, 'opponent': type(self.opponent).__name__,
+                                  'rng': {role: component.rng.getState() for role, component in self.__randomComponents()}})
+
+    def __randomComponents(self):
+        return (('game', self), ('env', self.env), ('agent', self.agent), ('opponent', self.opponent))
+
+    def __loadCheckpoint(self, path, sink):
+        arrays, meta = loadArrays(path)
+        for role, player in (('agent', self.agent), ('opponent', self.opponent)):
+            if meta[role] != type(player).__name__:
+                raise ValueError("{} was trained with a {} {}, not {}".format(
+                    path, meta[role], role, type(player).__name__))
+            player.setTables({name.split('/', 1)[1]: table for name, table in arrays.items()
+                              if name.startswith(role + '/')})
+            player.setState({name.split('/', 1)[1]: array for name, array in arrays.items()
+                             if name.startswith(role + '.state/')})
+        for role, component in self.__randomComponents():
+            component.rng.setState(meta['rng'][role])
+        sink.setState(arrays)
+        return meta
 
     # epsilon defines a unified exploration rate during training for both players
-    def train(self):
-        count = 0
-        error = []
-        current_val = self.__sampleAgentQValue()
+    # with checkpointPath, a checkpoint is written every checkpointEvery episodes and at the end,
+    # and if the file already exists training resumes from it at the saved episode, alpha and epsilon
+    # returns the error curve, the change of a sampled Q value in every episode,
+    # or None if the metrics sink of the game has no ErrorCurve
+    def train(self, checkpointPath=None, checkpointEvery=1000):
         alpha = self.alpha_start
         epsilon = self.epsilon_start
-        memory = deque(maxlen=100)
-        for episode in range(self.numEpisode):
-            n = 1000
-            if episode % n == n-1:
-                print("episode: {} / {}, win rate={:.2f}, alpha={:.4f}, epsilon={:4f}".format(episode,
-                    self.numEpisode, np.average(memory), alpha, epsilon))
+        sink = self.__metricsSink()
+        start = 0
+        if checkpointPath is not None and os.path.exists(checkpointPath):
+            meta = self.__loadCheckpoint(checkpointPath, sink)
+            start, alpha, epsilon = meta['episode'] + 1, meta['alpha'], meta['epsilon']
+        sink.open(start)
+        if self.profiler is not None:
+            self.profiler.start(self, self.env)
+        totalSteps = 0
+        current_val = self.__sampleAgentQValue()
+        for episode in range(start, self.numEpisode):
             s = self.env.reset()
             step = 0
             while True:
-                if np.random.random()<epsilon:
-                    agentAct = np.random.randint(self.env.action_space)
+                if self.__explore(epsilon):
+                    agentAct = self.rng.integers(self.env.action_space)
                 else:
-                    agentAct = self.agent.act(s[0], s[1], s[2])
-                if np.random.random()<epsilon:
-                    opponentAct = np.random.randint(self.env.action_space)
+                    agentAct = self.agent.act(s)
+                if self.__explore(epsilon):
+                    opponentAct = self.rng.integers(self.env.action_space)
                 else:
-                    opponentAct = self.opponent.act(s[0], s[1], s[2])
-                if (s[0],s[1],s[2],agentAct,opponentAct)==(2,1,False,1,4): count += 1
+                    opponentAct = self.opponent.act(s)
                 s_prime, reward, done = self.env.step(agentAct, opponentAct)
-                self.agent.learn(alpha, s[0], s[1], s[2], agentAct, opponentAct,
-                            s_prime[0], s_prime[1], s_prime[2], reward, -reward, done)
-                self.opponent.learn(alpha, s[0], s[1], s[2], opponentAct, agentAct,
-                            s_prime[0], s_prime[1], s_prime[2], -reward, reward, done)
+                totalSteps += 1
+                if self.replay is None:
+                    self.agent.learn(alpha, s, agentAct, opponentAct, s_prime, reward, -reward, done)
+                    self.opponent.learn(alpha, s, opponentAct, agentAct, s_prime, -reward, reward, done)
+                else:
+                    self.replay.learn(self.agent, self.opponent, alpha, self.gamma,
+                                      s, agentAct, opponentAct, s_prime, reward, done)
                 if done or step > self.maxStep:
-                    memory.append(reward==100)
                     break
                 s = s_prime
                 step += 1
+            new_val = self.__sampleAgentQValue()
+            sink.record(episode, abs(new_val - current_val), step + 1, np.sign(reward), alpha, epsilon)
+            current_val = new_val
             if alpha > self.alpha_min:
                 alpha *= self.alpha_decay
             if epsilon > self.epsilon_min:
                     epsilon *= self.epsilon_decay
+            if checkpointPath is not None and (episode % checkpointEvery == checkpointEvery-1 or episode == self.numEpisode-1):
+                self.__saveCheckpoint(checkpointPath, episode, alpha, epsilon, sink)
+        if self.profiler is not None:
+            self.profiler.stop(self.numEpisode - start, totalSteps)
+        sink.close()
+        return self.__errorCurve(sink)
+
+    def __errorCurve(self, sink):
+        curve = sink.find(ErrorCurve)
+        return None if curve is None else curve.values
+
+    # train on numGames games played in lock-step by a BatchSoccerEnviroment
+    # the players act and learn through actBatch and learnBatch, which agents without a vectorized
+    # version inherit from ISoccerGameAgent as a loop over act and learn
+    # alpha and epsilon decay once for every finished episode as in train
+    # a game that is done is reset by the enviroment, a game longer than maxStep is reset here
+    # the episodes that finish in the same step share one change of the sampled Q value,
+    # the first of them gets it in its metrics record and the others 0
+    def trainBatch(self, numGames=64):
+        if self.replay is not None:
+            raise ValueError("prioritized replay works with train, not trainBatch")
+        alpha = self.alpha_start
+        epsilon = self.epsilon_start
+        sink = self.__metricsSink()
+        sink.open()
+        env = BatchSoccerEnviroment(numGames, self.rng.spawn(1)[0], self.env.field)
+        numActions = env.action_space
+        if self.profiler is not None:
+            self.profiler.start(self, env)
+        s = env.reset()
+        steps = np.zeros(numGames, dtype=int)
+        totalSteps = 0
+        current_val = self.__sampleAgentQValue()
+        episode = 0
+        while episode < self.numEpisode:
+            agentAct = self.__actBatch(self.agent, s, epsilon, numActions)
+            opponentAct = self.__actBatch(self.opponent, s, epsilon, numActions)
+            s_prime, reward, done = env.step(agentAct, opponentAct)
+            totalSteps += numGames
+            # the enviroment already put finished games back to their start state,
+            # learning only needs s_prime of the games that go on
+            self.agent.learnBatch(alpha, s, agentAct, opponentAct, s_prime, reward, -reward, done)
+            self.opponent.learnBatch(alpha, s, opponentAct, agentAct, s_prime, -reward, reward, done)
+            timeout = ~done & (steps > self.maxStep)
+            if timeout.any():
+                s_prime = env.reset(timeout)
+            finished = done | timeout
+            lengths = steps[finished] + 1
+            steps = np.where(finished, 0, steps + 1)
+            s = s_prime
+            # the last step can finish more games than are left, only the first ones count
+            numDone = min(np.count_nonzero(finished), self.numEpisode - episode)
+            if numDone == 0:
+                continue
+            lengths = lengths[:numDone]
+            alphas = np.empty(numDone)
+            epsilons = np.empty(numDone)
+            for i in range(numDone):
+                alphas[i], epsilons[i] = alpha, epsilon
+                if alpha > self.alpha_min:
+                    alpha *= self.alpha_decay
+                if epsilon > self.epsilon_min:
+                    epsilon *= self.epsilon_decay
             new_val = self.__sampleAgentQValue()
-            error.append(abs(new_val - current_val))
+            qDelta = np.zeros(numDone)
+            qDelta[0] = abs(new_val - current_val)
             current_val = new_val
-        print(count)
-        return error
+            sink.recordMany(np.arange(episode, episode + numDone), qDelta, lengths, np.sign(reward[finished][:numDone]),
+                            alphas, epsilons)
+            episode += numDone
+        if self.profiler is not None:
+            self.profiler.stop(episode, totalSteps)
+        sink.close()
+        return self.__errorCurve(sink)
+
+    # epsilon greedy over a batch of games, only the games that do not explore ask the player
+    def __actBatch(self, player, s, epsilon, numActions):
+        actions = self.rng.integersMany(numActions, len(s))
+        greedy = self.rng.randomMany(len(s)) >= epsilon
+        if greedy.any():
+            actions[greedy] = player.actBatch(s[greedy])
+        return actions
 
     def play(self, render=True):
         s = self.env.reset()
@@ -82,8 +232,8 @@ class SoccerGame:
         if render:
             self.env.render()
         while True:
-            agentAct = self.agent.act(s[0], s[1], s[2])
-            opponentAct = self.opponent.act(s[0], s[1], s[2])
+            agentAct = self.agent.act(s)
+            opponentAct = self.opponent.act(s)
             s_prime, reward, done = self.env.step(agentAct, opponentAct)
             if render:
                 print("\n", agentAct, opponentAct)
@@ -95,7 +245,12 @@ class SoccerGame:
         return reward
 
     def evaluate(self, num=10000):
+        if self.profiler is not None:
+            self.profiler.start(self, self.env)
+            stepsBefore = self.profiler.calls['env.step']
         rewards = []
         for i in range(num):
             rewards.append(self.play(False)==100)
+        if self.profiler is not None:
+            self.profiler.stop(num, self.profiler.calls['env.step'] - stepsBefore)
         return np.average(rewards)
\ No newline at end of file
@@ -0,0 +1,349 @@
+import numpy as np
+
+# cvxopt takes longer to import than the rest of the game together and only the LP solvers use it,
+# so it is imported when the first of them is built, a process that only plays (e.g. an evaluation
+# worker) or uses the simplex never loads it
+matrix = spmatrix = solvers = None
+
+def _importCvxopt():
+    global matrix, spmatrix, solvers
+    if solvers is None:
+        from cvxopt import matrix, spmatrix, solvers
+
+# every solver also has solveMany, which solves a stack of independent games (e.g. the games of Q[states])
+# at once and returns the stacked results, the cvxopt solvers put batchSize games at a time into one
+# block diagonal LP with sparse constraint matrices, so the python and cvxopt overhead of a solve is paid
+# once per batch, the games do not interact, so each block is solved as if on its own up to the tolerance
+# of the solver, but the interior point method needs more iterations the more blocks the LP has,
+# batchSize is where that starts to cost more than it saves
+
+# a sparse block diagonal matrix of the dense blocks (k, rows, columns)
+def blockDiagonal(blocks):
+    k, rows, columns = blocks.shape
+    b, i, j = np.nonzero(blocks)
+    return spmatrix(blocks[b, i, j].tolist(), (b * rows + i).tolist(), (b * columns + j).tolist(),
+                    (k * rows, k * columns))
+
+# MinimaxLPSolver solves for the maximin strategy of a zero sum matrix game using LP
+# the game matrix has a row for each opponent action and a column for each agent action
+# which is Q(s) transposed, see FoeQ
+# the variables are pi(0), ..., pi(n-1) and V, and the LP is
+#   maximize    V
+#   subject to  sum(pi(a) * gameMatrix[o, a]) - V >= 0    for each opponent action o
+#               pi(a) >= 0
+#               sum(pi(a)) = 1
+# in cvxopt form: minimize c'x subject to Gx + s = h, s >= 0 and Ax = b
+# only the top left block of G depends on the game, so G, h, c, A and b are allocated once
+# and the game matrix is written into G in place through a numpy view of its memory
+# the solution for each state is kept, and the next solve for the same state is warm started from it
+class MinimaxLPSolver:
+    # methods a Profiler times separately from solve, see profiling.py
+    PROFILE_PHASES = {'lp': '_MinimaxLPSolver__lp'}
+    # how far a warm start is pulled towards the uniform policy to move it inside the feasible region
+    WARM_START_MIX = 0.001
+
+    def __init__(self, numActions, warmStart=True, batchSize=32):
+        _importCvxopt()
+        n = numActions
+        self.numActions = n
+        self.warmStart = warmStart
+        self.batchSize = batchSize
+        self.G = matrix(0.0, (2 * n, n + 1))
+        G = np.asarray(self.G)
+        # -sum(pi(a) * gameMatrix[o, a]) + V <= 0, the game block is filled in for each solve
+        G[:n, n] = 1
+        self.__gameBlock = G[:n, :n]
+        # -pi(a) <= 0
+        G[n:, :n] = -np.eye(n)
+        self.h = matrix(0.0, (2 * n, 1))
+        self.c = matrix([0.0] * n + [-1.0])
+        self.A = matrix([1.0] * n + [0.0], (1, n + 1))
+        self.b = matrix(1.0)
+        self.options = {'show_progress': False}
+        # last solution for each state: key -> (x, y, z)
+        self.__solutions = {}
+        self.numSolves = 0
+        self.numWarmStarts = 0
+
+    # the warm start solutions as arrays, keys and the stacked x, y and z of their solutions
+    def getState(self):
+        keys = list(self.__solutions)
+        state = {'keys': np.array(keys, dtype=np.int64), 'counts': np.array([self.numSolves, self.numWarmStarts])}
+        n = self.numActions
+        for i, (name, width) in enumerate((('x', n + 1), ('y', 1), ('z', 2 * n))):
+            state[name] = np.array([self.__solutions[key][i] for key in keys]).reshape(len(keys), width)
+        return state
+
+    def setState(self, state):
+        self.__solutions = {int(key): (np.array(x), np.array(y), np.array(z))
+                            for key, x, y, z in zip(state['keys'], state['x'], state['y'], state['z'])}
+        self.numSolves, self.numWarmStarts = (int(count) for count in state['counts'])
+
+    # build a strictly feasible starting point close to the last solution of the same game
+    def __startingPoint(self, key, gameMatrix):
+        x, y, z = self.__solutions[key]
+        n = self.numActions
+        pi = (1 - self.WARM_START_MIX) * x[:n] + self.WARM_START_MIX / n
+        values = gameMatrix @ pi
+        V = values.min() - self.WARM_START_MIX * (1 + np.abs(values).max())
+        s = np.concatenate((values - V, pi))
+        primal = {'x': matrix(np.append(pi, V)), 's': matrix(s)}
+        dual = {'y': matrix(y), 'z': matrix(z + self.WARM_START_MIX)}
+        return primal, dual
+
+    # lp is (c, G, h, A, b), the single game LP by default, solveMany passes its block diagonal LP
+    def __lp(self, lp=None, primal=None, dual=None):
+        c, G, h, A, b = lp or (self.c, self.G, self.h, self.A, self.b)
+        return solvers.lp(c, G, h, A, b, primalstart=primal, dualstart=dual, options=self.options)
+
+    # returns the maximin policy of the agent and the value of the game
+    # key identifies the game (e.g. the state), solutions are only reused for the same key
+    def solve(self, gameMatrix, key=None):
+        np.negative(gameMatrix, out=self.__gameBlock)
+        sol = None
+        if self.warmStart and key in self.__solutions:
+            try:
+                sol = self.__lp(None, *self.__startingPoint(key, gameMatrix))
+                self.numWarmStarts += 1
+            except ValueError:
+                sol = None
+            if sol is not None and sol['status'] != 'optimal':
+                sol = None
+        if sol is None:
+            sol = self.__lp()
+        self.numSolves += 1
+        x = np.array(sol['x']).ravel()
+        if self.warmStart and key is not None:
+            self.__solutions[key] = (x, np.array(sol['y']).ravel(), np.array(sol['z']).ravel())
+        return x[:self.numActions], x[self.numActions]
+
+    # returns the policies (k, n) and values (k,) of the games (k, n, n)
+    # a batch is warm started when all its keys have a solution, from the starting points of solve
+    # stacked, and the solutions are kept for the keys as in solve
+    def solveMany(self, gameMatrices, keys=None):
+        pi = np.empty(gameMatrices.shape[:2])
+        V = np.empty(len(gameMatrices))
+        for start in range(0, len(gameMatrices), self.batchSize):
+            batch = slice(start, start + self.batchSize)
+            pi[batch], V[batch] = self.__solveBlocks(gameMatrices[batch], None if keys is None else keys[batch])
+        return pi, V
+
+    def __solveBlocks(self, gameMatrices, keys):
+        n = self.numActions
+        k = len(gameMatrices)
+        G = np.zeros((k, 2 * n, n + 1))
+        np.negative(gameMatrices, out=G[:, :n, :n])
+        G[:, :n, n] = 1
+        G[:, n:, :n] = -np.eye(n)
+        A = np.broadcast_to(np.asarray(self.A), (k, 1, n + 1))
+        lp = (matrix(np.tile(np.asarray(self.c), (k, 1))), blockDiagonal(G), matrix(0.0, (k * 2 * n, 1)),
+              blockDiagonal(A), matrix(1.0, (k, 1)))
+        sol = None
+        if self.warmStart and keys is not None and all(key in self.__solutions for key in keys):
+            starts = [self.__startingPoint(key, gameMatrix) for key, gameMatrix in zip(keys, gameMatrices)]
+            primal, dual = [{name: matrix(np.concatenate([np.array(start[i][name]).ravel() for start in starts]))
+                             for name in starts[0][i]} for i in range(2)]
+            try:
+                sol = self.__lp(lp, primal, dual)
+                self.numWarmStarts += k
+            except ValueError:
+                sol = None
+            if sol is not None and sol['status'] != 'optimal':
+                sol = None
+        if sol is None:
+            sol = self.__lp(lp)
+        self.numSolves += k
+        x = np.array(sol['x']).reshape(k, n + 1)
+        if self.warmStart and keys is not None:
+            y = np.array(sol['y']).reshape(k, 1)
+            z = np.array(sol['z']).reshape(k, 2 * n)
+            for key, xBlock, yBlock, zBlock in zip(keys, x, y, z):
+                self.__solutions[key] = (xBlock, yBlock, zBlock)
+        return x[:, :n], x[:, n]
+
+
+# MinimaxSimplexSolver solves the same maximin problem as MinimaxLPSolver without cvxopt
+# it is a dense tableau simplex sized for the tiny games of the soccer field
+# shifting the game matrix by a constant so every entry is at least 1 does not change pi
+# and turns the game into the LP (see e.g. Littman 1994, or any text on matrix games)
+#   maximize    sum(y)
+#   subject to  gameMatrix.T @ y <= 1, y >= 0
+# which is feasible at y = 0, so the simplex starts from the slack basis without a phase 1
+# at the optimum the duals of the constraints x(a) give pi = x / sum(x) and V = 1 / sum(y) - shift
+# when a game has several optimal policies (e.g. all Q values equal) this returns a vertex of them,
+# while the interior point method of cvxopt tends to return one in the middle
+class MinimaxSimplexSolver:
+    MAX_PIVOTS = 50
+    EPS = 1e-12
+
+    def __init__(self, numActions):
+        n = numActions
+        self.numActions = n
+        # one row per agent action plus the objective row,
+        # columns are y for each opponent action, the slacks and the right hand side
+        self.tableau = np.zeros((n + 1, 2 * n + 1))
+        # everything but the game block is the same at the start of every solve
+        self.__start = np.zeros((n + 1, 2 * n + 1))
+        self.__start[:n, n:2 * n] = np.eye(n)
+        self.__start[:n, -1] = 1
+        self.__start[n, :n] = -1
+        self.__ratios = np.empty(n)
+        self.numSolves = 0
+
+    # returns the maximin policy of the agent and the value of the game
+    # key is accepted for compatibility with MinimaxLPSolver, there is nothing to warm start
+    def solve(self, gameMatrix, key=None):
+        n = self.numActions
+        T = self.tableau
+        shift = 1 - gameMatrix.min()
+        T[:] = self.__start
+        np.add(gameMatrix.T, shift, out=T[:n, :n])
+        objective = T[n, :2 * n]
+        rhs = T[:n, -1]
+        ratios = self.__ratios
+        for i in range(self.MAX_PIVOTS):
+            # entering column is the most negative reduced cost
+            col = objective.argmin()
+            if objective[col] >= -self.EPS:
+                break
+            # leaving row by the ratio test over the positive entries of the column
+            column = T[:n, col]
+            ratios.fill(np.inf)
+            np.divide(rhs, column, out=ratios, where=column > self.EPS)
+            row = ratios.argmin()
+            pivotRow = T[row] / T[row, col]
+            T -= np.outer(T[:, col], pivotRow)
+            T[row] = pivotRow
+        self.numSolves += 1
+        x = T[n, n:2 * n]
+        z = T[n, -1]
+        return x / x.sum(), 1 / z - shift
+
+    # returns the policies (k, n) and values (k,) of the games (k, n, n), keys are ignored as in solve
+    # the tableaus of all games pivot together, a game stops pivoting once it is optimal,
+    # every game takes the same pivots as in solve, so the results are the same
+    def solveMany(self, gameMatrices, keys=None):
+        n = self.numActions
+        k = len(gameMatrices)
+        T = np.tile(self.__start, (k, 1, 1))
+        shift = 1 - gameMatrices.min(axis=(1, 2))
+        np.add(np.swapaxes(gameMatrices, 1, 2), shift[:, None, None], out=T[:, :n, :n])
+        for i in range(self.MAX_PIVOTS):
+            objective = T[:, n, :2 * n]
+            col = objective.argmin(axis=1)
+            games = np.flatnonzero(objective[np.arange(k), col] < -self.EPS)
+            if len(games) == 0:
+                break
+            col = col[games]
+            column = T[games, :n, col]
+            ratios = np.full(column.shape, np.inf)
+            np.divide(T[games, :n, -1], column, out=ratios, where=column > self.EPS)
+            row = ratios.argmin(axis=1)
+            pivotRow = T[games, row] / T[games, row, col][:, None]
+            T[games] -= T[games, :, col][:, :, None] * pivotRow[:, None, :]
+            T[games, row] = pivotRow
+        self.numSolves += k
+        x = T[:, n, n:2 * n]
+        z = T[:, n, -1]
+        return x / x.sum(axis=1, keepdims=True), 1 / z - shift
+
+
+# CEConstraintBuilder builds the LP of the utilitarian correlated equilibrium used by CEQ
+# the variables are the joint policy pi(i, k) of agent action i and opponent action k at column n*i+k
+# set 1, the rationality constraints, has a row for every pair of different actions i, j of each player
+#   agent:     sum over k of pi(i, k) * (Q(i, k) - Q(j, k)) >= 0
+#   opponent:  sum over k of pi(k, i) * (Qo(k, i) - Qo(k, j)) >= 0
+# in the order i = 0..n-1, j = 0..n-1 skipping i == j, agent rows first
+# only 2 * n * (n - 1) * n entries of this block are non-zero and their positions never change,
+# so they are computed once and the values are scattered in with one broadcast for each player
+# set 2, pi >= 0 and sum(pi) = 1, does not depend on the state and is kept from construction
+# rationality() also takes stacks of games, e.g. Q[states], and returns one block per game
+class CEConstraintBuilder:
+    def __init__(self, numActions):
+        n = numActions
+        self.numActions = n
+        self.numJointActions = n * n
+        self.numRationality = 2 * n * (n - 1)
+        pairs = [(i, j) for i in range(n) for j in range(n) if i != j]
+        self.__i = np.array([i for i, j in pairs])
+        self.__j = np.array([j for i, j in pairs])
+        k = np.arange(n)
+        numPairs = len(pairs)
+        # agent row r = (i, j) has its entries at columns n*i+k, opponent row at n*k+i
+        self.__rowsA = np.repeat(np.arange(numPairs), n)
+        self.__colsA = (n * self.__i[:, None] + k).ravel()
+        self.__rowsB = self.__rowsA + numPairs
+        self.__colsB = (n * k + self.__i[:, None]).ravel()
+
+        # the whole LP in the form A x >= b, with sum(pi) = 1 as two inequalities as CEQ always had it
+        m = self.numJointActions
+        self.A = np.zeros((self.numRationality + m + 2, m))
+        self.A[self.numRationality:self.numRationality + m] = np.eye(m)
+        self.A[-2] = 1
+        self.A[-1] = -1
+        self.b = np.zeros(self.numRationality + m + 2)
+        self.b[-2:] = [1, -1]
+
+    # returns the rationality block(s) for game matrices Q and opponentQ of shape (..., n, n)
+    def rationality(self, Q, opponentQ, out=None):
+        batchShape = np.shape(Q)[:-2]
+        if out is None:
+            out = np.zeros(batchShape + (self.numRationality, self.numJointActions))
+        valuesA = Q[..., self.__i, :] - Q[..., self.__j, :]
+        valuesB = opponentQ[..., :, self.__i] - opponentQ[..., :, self.__j]
+        valuesB = np.swapaxes(valuesB, -1, -2)
+        out[..., self.__rowsA, self.__colsA] = valuesA.reshape(batchShape + (-1,))
+        out[..., self.__rowsB, self.__colsB] = valuesB.reshape(batchShape + (-1,))
+        return out
+
+    # fills the rationality rows of the single game LP in place
+    # returns A, b and the utilitarian objective c, to maximize c'x subject to A x >= b
+    def build(self, Q, opponentQ):
+        self.rationality(Q, opponentQ, out=self.A[:self.numRationality])
+        c = (Q + opponentQ).ravel()
+        return self.A, self.b, c
+
+
+# CELPSolver solves the utilitarian correlated equilibrium of a game with cvxopt
+# returns the joint policy pi(agent action, opponent action)
+class CELPSolver:
+    # methods a Profiler times separately from solve, see profiling.py
+    PROFILE_PHASES = {'build': 'build', 'lp': '_CELPSolver__lp'}
+
+    def __init__(self, numActions, batchSize=8):
+        _importCvxopt()
+        self.numActions = numActions
+        self.batchSize = batchSize
+        self.constraints = CEConstraintBuilder(numActions)
+        self.options = {'show_progress': False}
+        self.numSolves = 0
+
+    def build(self, Q, opponentQ):
+        return self.constraints.build(Q, opponentQ)
+
+    # minimize c'x subject to G x <= h
+    def __lp(self, c, G, h):
+        return solvers.lp(c, G, h, options=self.options)
+
+    # use negative sign to convert max to min
+    def solve(self, Q, opponentQ):
+        A, b, c = self.build(Q, opponentQ)
+        sol = self.__lp(matrix(-c), matrix(-A), matrix(-b))
+        self.numSolves += 1
+        return np.array(sol['x']).reshape(self.numActions, self.numActions)
+
+    # returns the joint policies (k, n, n) of the games Q and opponentQ (k, n, n)
+    def solveMany(self, Q, opponentQ):
+        return np.concatenate([self.__solveBlocks(Q[start:start + self.batchSize], opponentQ[start:start + self.batchSize])
+                               for start in range(0, len(Q), self.batchSize)])
+
+    def __solveBlocks(self, Q, opponentQ):
+        n = self.numActions
+        k = len(Q)
+        constraints = self.constraints
+        A = np.tile(constraints.A, (k, 1, 1))
+        constraints.rationality(Q, opponentQ, out=A[:, :constraints.numRationality])
+        c = (Q + opponentQ).reshape(-1)
+        sol = self.__lp(matrix(-c), blockDiagonal(-A), matrix(np.tile(-constraints.b, k)))
+        self.numSolves += k
+        return np.array(sol['x']).reshape(k, n, n)
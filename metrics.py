@@ -0,0 +1,292 @@
+# streaming metrics of training runs
+# SoccerGame.train and trainBatch write one record per episode into a MetricsSink, which holds the records
+# in a preallocated numpy buffer of chunkSize records and hands every full chunk to its consumers,
+# so memory does not grow with the number of episodes unless a consumer keeps everything (ErrorCurve)
+#
+# a record is (episode, qDelta, length, winner, alpha, epsilon):
+#   qDelta is the change of the sampled agent Q value since the previous record,
+#   winner is 1 if the agent scored, -1 if the opponent scored and 0 if the episode timed out,
+#   alpha and epsilon are the rates the episode was played with
+#
+# a consumer is any object with consume(records), records is a view of the buffer that is only valid
+# during the call, so consumers copy what they keep. consumers can also have
+#   open(startEpisode)   called when a run starts, startEpisode > 0 when it resumes from a checkpoint
+#   close()              called when the run ends
+#   getState/setState    arrays a training checkpoint saves and restores (see SoccerGame.train)
+#   flushEvery           the sink also flushes after every episode e with e % flushEvery == flushEvery - 1,
+#                        for consumers that report progress and should not wait for a full chunk
+import json
+import os
+import struct
+import numpy as np
+
+RECORD_DTYPE = np.dtype([('episode', '<i8'), ('qDelta', '<f8'), ('length', '<i4'), ('winner', 'i1'),
+                         ('alpha', '<f8'), ('epsilon', '<f8')])
+
+class MetricsSink:
+    def __init__(self, consumers=(), chunkSize=4096):
+        self.consumers = list(consumers)
+        self.buffer = np.zeros(chunkSize, dtype=RECORD_DTYPE)
+        self.size = 0
+        self.flushEvery = None
+
+    # the first consumer of a type, or None
+    def find(self, consumerType):
+        for consumer in self.consumers:
+            if isinstance(consumer, consumerType):
+                return consumer
+        return None
+
+    def open(self, startEpisode=0):
+        self.size = 0
+        intervals = [consumer.flushEvery for consumer in self.consumers if getattr(consumer, 'flushEvery', None)]
+        self.flushEvery = min(intervals) if intervals else None
+        for consumer in self.consumers:
+            if hasattr(consumer, 'open'):
+                consumer.open(startEpisode)
+
+    def record(self, episode, qDelta, length, winner, alpha, epsilon):
+        self.buffer[self.size] = (episode, qDelta, length, winner, alpha, epsilon)
+        self.size += 1
+        if self.size == len(self.buffer) or self.__isDue(episode):
+            self.flush()
+
+    def __isDue(self, episode):
+        return self.flushEvery is not None and episode % self.flushEvery == self.flushEvery - 1
+
+    # write many records at once, each argument is an array or a scalar shared by all of them
+    def recordMany(self, episode, qDelta, length, winner, alpha, epsilon):
+        episode = np.atleast_1d(episode)
+        start = 0
+        while start < len(episode):
+            num = min(len(episode) - start, len(self.buffer) - self.size)
+            due = False
+            if self.flushEvery is not None:
+                ends = np.flatnonzero(episode[start:start + num] % self.flushEvery == self.flushEvery - 1)
+                if len(ends):
+                    num, due = ends[0] + 1, True
+            chunk = self.buffer[self.size:self.size + num]
+            part = slice(start, start + num)
+            for name, values in (('episode', episode), ('qDelta', qDelta), ('length', length),
+                                 ('winner', winner), ('alpha', alpha), ('epsilon', epsilon)):
+                chunk[name] = values[part] if np.ndim(values) else values
+            self.size += num
+            start += num
+            if self.size == len(self.buffer) or due:
+                self.flush()
+
+    def flush(self):
+        if self.size == 0:
+            return
+        records = self.buffer[:self.size]
+        for consumer in self.consumers:
+            consumer.consume(records)
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        for consumer in self.consumers:
+            if hasattr(consumer, 'close'):
+                consumer.close()
+
+    def getState(self):
+        state = {}
+        for consumer in self.consumers:
+            if hasattr(consumer, 'getState'):
+                state.update(consumer.getState())
+        return state
+
+    def setState(self, state):
+        for consumer in self.consumers:
+            if hasattr(consumer, 'setState'):
+                consumer.setState(state)
+
+# keeps the qDelta of every episode, the error curve SoccerGame.train returns
+class ErrorCurve:
+    def __init__(self, capacity=1024):
+        self.__values = np.zeros(capacity)
+        self.size = 0
+
+    @property
+    def values(self):
+        return self.__values[:self.size]
+
+    def extend(self, values):
+        if self.size + len(values) > len(self.__values):
+            grown = np.zeros(max(2 * len(self.__values), self.size + len(values)))
+            grown[:self.size] = self.values
+            self.__values = grown
+        self.__values[self.size:self.size + len(values)] = values
+        self.size += len(values)
+
+    def consume(self, records):
+        self.extend(records['qDelta'])
+
+    def getState(self):
+        return {'error': self.values.copy()}
+
+    def setState(self, state):
+        self.size = 0
+        if 'error' in state:
+            self.extend(state['error'])
+
+# prints the win rate of the last window episodes every `every` episodes, as soon as they are played
+class ProgressPrinter:
+    def __init__(self, numEpisode, every=1000, window=100):
+        self.numEpisode = numEpisode
+        self.every = every
+        self.flushEvery = every
+        self.recent = np.zeros(window, dtype=bool)
+        self.numRecent = 0
+
+    def consume(self, records):
+        for record in records:
+            self.recent[self.numRecent % len(self.recent)] = record['winner'] == 1
+            self.numRecent += 1
+            if record['episode'] % self.every == self.every - 1:
+                print("episode: {} / {}, win rate={:.2f}, alpha={:.4f}, epsilon={:4f}".format(record['episode'],
+                    self.numEpisode, self.winRate(), record['alpha'], record['epsilon']))
+
+    def winRate(self):
+        return np.average(self.recent[:min(self.numRecent, len(self.recent))]) if self.numRecent else np.nan
+
+    # the window in the order the episodes were played, oldest first
+    def getState(self):
+        num = min(self.numRecent, len(self.recent))
+        return {'memory': np.roll(self.recent, -self.numRecent)[len(self.recent) - num:]}
+
+    def setState(self, state):
+        memory = state.get('memory', [])[-len(self.recent):]
+        self.recent[:len(memory)] = memory
+        self.numRecent = len(memory)
+
+# summaries of every binSize episodes: win, loss and timeout rates, mean episode length,
+# mean and max qDelta and the alpha and epsilon at the end of the bin
+class Aggregator:
+    FIELDS = ('episode', 'winRate', 'lossRate', 'timeoutRate', 'meanLength', 'meanQDelta', 'maxQDelta',
+              'alpha', 'epsilon')
+
+    def __init__(self, binSize=1000):
+        self.binSize = binSize
+        self.bins = {field: [] for field in self.FIELDS}
+        self.__pending = np.zeros(binSize, dtype=RECORD_DTYPE)
+        self.__numPending = 0
+
+    def consume(self, records):
+        start = 0
+        while start < len(records):
+            num = min(len(records) - start, self.binSize - self.__numPending)
+            self.__pending[self.__numPending:self.__numPending + num] = records[start:start + num]
+            self.__numPending += num
+            start += num
+            if self.__numPending == self.binSize:
+                self.__summarize()
+
+    def __summarize(self):
+        records = self.__pending[:self.__numPending]
+        last = records[-1]
+        for field, value in (('episode', last['episode']), ('winRate', np.mean(records['winner'] == 1)),
+                             ('lossRate', np.mean(records['winner'] == -1)),
+                             ('timeoutRate', np.mean(records['winner'] == 0)),
+                             ('meanLength', np.mean(records['length'])), ('meanQDelta', np.mean(records['qDelta'])),
+                             ('maxQDelta', np.max(records['qDelta'])), ('alpha', last['alpha']),
+                             ('epsilon', last['epsilon'])):
+            self.bins[field].append(float(value))
+        self.__numPending = 0
+
+    # a partly filled last bin is summarized when the run ends
+    def close(self):
+        if self.__numPending:
+            self.__summarize()
+
+    def summary(self):
+        return {field: np.array(values) for field, values in self.bins.items()}
+
+# a live plot of the qDelta and the win rate of every binSize episodes, needs an interactive matplotlib backend
+class LivePlot:
+    def __init__(self, binSize=1000):
+        self.aggregator = Aggregator(binSize)
+        self.figure = None
+
+    def consume(self, records):
+        numBins = len(self.aggregator.bins['episode'])
+        self.aggregator.consume(records)
+        if len(self.aggregator.bins['episode']) > numBins:
+            self.__draw()
+
+    def __draw(self):
+        from matplotlib import pyplot as plt
+        if self.figure is None:
+            plt.ion()
+            self.figure, self.axes = plt.subplots(2, 1, sharex=True)
+        summary = self.aggregator.summary()
+        for ax, field, label in ((self.axes[0], 'maxQDelta', 'max Q delta'), (self.axes[1], 'winRate', 'win rate')):
+            ax.clear()
+            ax.plot(summary['episode'], summary[field], linewidth=0.5)
+            ax.set_ylabel(label)
+        self.axes[1].set_xlabel('episode')
+        plt.pause(0.001)
+
+    def close(self):
+        self.aggregator.close()
+
+# streams the records to a binary file: magic | version (uint32) | header length (uint32) | json header | records
+# the header holds the record dtype, the records are written as they are in memory, one chunk at a time
+# on resume the records of the episodes from startEpisode on are cut off, they will be played again
+MAGIC = b'SOCCERM\x00'
+FORMAT_VERSION = 1
+
+class FileConsumer:
+    def __init__(self, path, meta=None):
+        self.path = path
+        self.meta = meta or {}
+        self.file = None
+
+    def open(self, startEpisode=0):
+        if startEpisode > 0 and os.path.exists(self.path):
+            records = readMetrics(self.path, mmap=True)
+            keep = int(np.count_nonzero(records['episode'] < startEpisode))
+            offset = _dataStart(self.path)
+            del records
+            self.file = open(self.path, 'r+b')
+            self.file.truncate(offset + keep * RECORD_DTYPE.itemsize)
+            self.file.seek(0, os.SEEK_END)
+            return
+        self.file = open(self.path, 'wb')
+        header = json.dumps({'dtype': RECORD_DTYPE.descr, 'meta': self.meta}).encode()
+        self.file.write(MAGIC)
+        self.file.write(struct.pack('<II', FORMAT_VERSION, len(header)))
+        self.file.write(header)
+
+    def consume(self, records):
+        if self.file is None:
+            self.open()
+        self.file.write(records.tobytes())
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def _readHeader(f, path):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("{} is not a metrics file".format(path))
+    version, headerLength = struct.unpack('<II', f.read(8))
+    if version > FORMAT_VERSION:
+        raise ValueError("{} has format version {}, this code reads up to {}".format(path, version, FORMAT_VERSION))
+    return json.loads(f.read(headerLength).decode()), len(MAGIC) + 8 + headerLength
+
+def _dataStart(path):
+    with open(path, 'rb') as f:
+        return _readHeader(f, path)[1]
+
+# the records of a metrics file as a structured array, with mmap=True a read only view of the file
+def readMetrics(path, mmap=False):
+    with open(path, 'rb') as f:
+        header, offset = _readHeader(f, path)
+    dtype = np.dtype([tuple(field) for field in header['dtype']])
+    num = (os.path.getsize(path) - offset) // dtype.itemsize
+    if mmap and num > 0:
+        return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(num,))
+    return np.fromfile(path, dtype=dtype, count=num, offset=offset)
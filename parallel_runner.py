@@ -0,0 +1,72 @@
+# ParallelRunner trains independent SoccerGame runs and evaluates matchups in a pool of processes
+# every job seeds its game from its own name and the root seed, so results do not depend on
+# how many workers there are or which worker picks up which job
+# a training job is a dict with the agent type and the SoccerGame parameters, see DEFAULT_PARAMS
+# both the agent and the opponent of a job are trained with the same agent type,
+# the parent gets back their tables (see ISoccerGameAgent.getTables) and the error curve
+# a matchup (agentJob, opponentJob) plays the agent of one job against the opponent of another,
+# 'Random' plays a randomPlayAgent
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from soccer import SoccerEnviroment
+from game_interface import SoccerGame
+from evaluation import Evaluator, jobSeed, makeAgent, makeField
+
+# the parameters used in run_game.py
+# field holds the keyword arguments of SoccerField, None is the 2x4 field of the paper
+DEFAULT_PARAMS = {
+    'numEpisode': 100000,
+    'alpha_start': 1,
+    'alpha_decay': 0.99993,
+    'alpha_min': 0.001,
+    'epsilon_start': 1,
+    'epsilon_decay': 0.99993,
+    'epsilon_min': 0.01,
+    'gamma': 0.99,
+    'maxStep': 500,
+    'field': None,
+}
+
+def runTraining(job, seed):
+    params = dict(DEFAULT_PARAMS, **job.get('params', {}))
+    env = SoccerEnviroment(field=makeField(params['field']))
+    agent = makeAgent(job['agent'], env, params['gamma'], job.get('agentArgs'))
+    opponent = makeAgent(job['agent'], env, params['gamma'], job.get('agentArgs'))
+    game = SoccerGame(params['numEpisode'], params['alpha_start'], params['alpha_decay'], params['alpha_min'],
+                      params['epsilon_start'], params['epsilon_decay'], params['epsilon_min'], params['gamma'],
+                      env, agent, opponent, params['maxStep'], seed=seed)
+    error = game.train()
+    return {'error': np.array(error), 'agent': agent.getTables(), 'opponent': opponent.getTables()}
+
+class ParallelRunner:
+    # numWorkers=None uses one worker per cpu
+    def __init__(self, numWorkers=None, seed=0):
+        self.numWorkers = numWorkers
+        self.seed = seed
+
+    # jobs maps a name to a training job, returns a dict of name -> result of runTraining
+    def train(self, jobs):
+        with ProcessPoolExecutor(self.numWorkers) as pool:
+            futures = {name: pool.submit(runTraining, job, jobSeed(self.seed, name))
+                       for name, job in jobs.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+    # returns a dict of (agentName, opponentName) -> EvaluationResult of the agent, see Evaluator
+    # with ciWidth=None every matchup plays num games, otherwise it stops once the win rate is settled
+    def evaluate(self, jobs, results, matchups, num=10000, ciWidth=None):
+        def player(name, role):
+            if name == 'Random':
+                return ('Random', None, None)
+            return (jobs[name]['agent'], jobs[name].get('agentArgs'), results[name][role])
+        # evaluation games are played with the gamma, maxStep and field of the jobs, which all share them
+        params = dict(DEFAULT_PARAMS, **next(iter(jobs.values())).get('params', {}))
+        evaluator = Evaluator(self.numWorkers, self.seed, maxGames=num, ciWidth=ciWidth,
+                              gamma=params['gamma'], maxStep=params['maxStep'], field=params['field'])
+        return evaluator.evaluate({matchup: (player(matchup[0], 'agent'), player(matchup[1], 'opponent'))
+                                   for matchup in matchups})
+
+# the experiment of run_game.py, which runs it on the same pool of worker processes
+if __name__ == '__main__':
+    import sys
+    from run_game import main
+    sys.exit(main())
@@ -0,0 +1,94 @@
+# exact model based solvers for the soccer game
+# the game is small and fully known, so instead of sampling episodes like SoccerGame.train
+# we can compute the fixed points of Foe-Q, Friend-Q and uCE-Q directly by value iteration
+# (Shapley 1953) over the TransitionTable of SoccerEnviroment
+#
+# both move orders happen with probability 0.5, so the backup of a joint action is
+#   Q[s,a,o] = sum over order of 0.5 * ((1-gamma) * reward + gamma * (1-done) * V[s'])
+# which is the expected value of the update the agents make in learn()
+# every sweep backs up all states at once, then solves the games of all states for the new V
+# with solveMany of the solvers, see game_solvers.py
+#
+# planFoeQ, planFriendQ and planCEQ return the tables in the flat state id layout of the agents,
+# e.g. FoeQ(env, gamma).setTables(planFoeQ(env, gamma)), for the player A (the agent in SoccerGame)
+# or with player='B' for the opponent, whose actions come first in its own tables and whose reward is -reward
+import numpy as np
+from soccer import SoccerEnviroment
+from game_solvers import MinimaxSimplexSolver, CELPSolver
+
+class MarkovGameModel:
+    def __init__(self, env=None, player='A'):
+        env = env or SoccerEnviroment()
+        table = env.getTransitionTable()
+        self.env = env
+        self.numStates = table.numStates
+        self.numActions = env.action_space
+        self.nextState = table.nextState
+        self.reward = table.reward.astype(float)
+        self.done = table.done
+        if player == 'B':
+            # B's own action comes first and it gets the negative reward
+            self.nextState = np.swapaxes(self.nextState, 1, 2)
+            self.reward = -np.swapaxes(self.reward, 1, 2)
+            self.done = np.swapaxes(self.done, 1, 2)
+        # states the game can be played from: the players are on different cells and nobody has scored
+        posWithBall = np.where(table.AHasBall, table.posOfA, table.posOfB)
+        scored = env.field.goalReward(posWithBall) != 0
+        self.playable = (table.posOfA != table.posOfB) & ~scored
+
+    # Q of every state and joint action given the values V of all states
+    def backup(self, V, gamma, reward=None):
+        reward = self.reward if reward is None else reward
+        target = (1 - gamma) * reward + gamma * np.where(self.done, 0, V[self.nextState])
+        return target.mean(axis=-1)
+
+# synchronous value iteration of one or more players' values, one per reward in rewards
+# solveStates gets the Q of each player and returns the new values stacked by player and anything
+# else it computed for the last sweep (e.g. pi)
+def valueIteration(model, gamma, solveStates, rewards, tol=1e-6, maxIterations=10000, verbose=False):
+    V = np.zeros((len(rewards), model.numStates))
+    for iteration in range(maxIterations):
+        newV, extra = solveStates(*[model.backup(V[i], gamma, reward) for i, reward in enumerate(rewards)])
+        delta = np.max(np.abs(newV - V))
+        V = newV
+        if verbose and iteration % 100 == 0:
+            print("iteration: {}, delta={:.2e}".format(iteration, delta))
+        if delta < tol:
+            break
+    return [model.backup(V[i], gamma, reward) for i, reward in enumerate(rewards)], V, extra
+
+def planFriendQ(env=None, gamma=0.99, player='A', **kwargs):
+    model = MarkovGameModel(env, player)
+    def solveStates(Q):
+        return np.where(model.playable, Q.max(axis=(1, 2)), 0)[None], None
+    (Q,), V, _ = valueIteration(model, gamma, solveStates, [model.reward], **kwargs)
+    return {'Q': Q}
+
+def planFoeQ(env=None, gamma=0.99, player='A', **kwargs):
+    model = MarkovGameModel(env, player)
+    solver = MinimaxSimplexSolver(model.numActions)
+    pi = np.ones((model.numStates, model.numActions)) / model.numActions
+    playable = np.flatnonzero(model.playable)
+    def solveStates(Q):
+        V = np.zeros((1, model.numStates))
+        pi[playable], V[0, playable] = solver.solveMany(np.swapaxes(Q[playable], 1, 2))
+        return V, pi
+    (Q,), V, pi = valueIteration(model, gamma, solveStates, [model.reward], **kwargs)
+    return {'Q': Q, 'V': V[0], 'pi': pi}
+
+# the CE operator needs the values of both players, CEQ keeps the opponent's as opponentQ and opponentV
+# with the same action order as its own, and the opponent gets the negative reward
+def planCEQ(env=None, gamma=0.99, player='A', **kwargs):
+    model = MarkovGameModel(env, player)
+    n = model.numActions
+    solver = CELPSolver(n)
+    pi = np.ones((model.numStates, n, n)) / (n * n)
+    playable = np.flatnonzero(model.playable)
+    def solveStates(Q, opponentQ):
+        V = np.zeros((2, model.numStates))
+        pi[playable] = solver.solveMany(Q[playable], opponentQ[playable])
+        V[0, playable] = np.sum(pi[playable] * Q[playable], axis=(1, 2))
+        V[1, playable] = np.sum(pi[playable] * opponentQ[playable], axis=(1, 2))
+        return V, pi
+    (Q, opponentQ), V, pi = valueIteration(model, gamma, solveStates, [model.reward, -model.reward], **kwargs)
+    return {'Q': Q, 'V': V[0], 'pi': pi, 'opponentQ': opponentQ, 'opponentV': V[1]}
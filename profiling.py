@@ -0,0 +1,129 @@
+# Profiler measures where SoccerGame spends its time
+# it is opt-in: SoccerGame(..., profiler=Profiler()) attaches it for the length of train, trainBatch
+# and evaluate by wrapping the methods of the game, the enviroment, both players and their solvers
+# with timed versions on the instances, and puts the original methods back afterwards
+# the solvers of FoeQ and CEQ are built on their first solve, the profiler does not build them but wraps
+# makeSolver of the player, so a solver built while profiling is timed from its first call
+# without a profiler nothing is wrapped, so the cost is a None check per call of train
+#
+# phases are named by where they happen, e.g. env.step, agent.act, opponent.learn,
+# agent.solve and agent.solveMany (the whole policy solve of FoeQ/CEQ, of one state or a stack of them)
+# and agent.lp (only the cvxopt call inside either)
+# phases nest (agent.lp is part of agent.solve, which is part of agent.learn), so shares add up to more than 100%
+# the summary holds calls, total and mean time of every phase and the episodes and steps per second,
+# a profiler used for several runs adds them up
+import json
+from collections import defaultdict
+from time import perf_counter
+
+class Profiler:
+    # dumpPath: write the summary as json there when profiling stops
+    # verbose: print the summary when profiling stops
+    def __init__(self, dumpPath=None, verbose=True):
+        self.dumpPath = dumpPath
+        self.verbose = verbose
+        self.calls = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.episodes = 0
+        self.steps = 0
+        self.wallSeconds = 0.0
+        self.players = {}
+        self.__wrapped = []
+        self.__start = None
+
+    def wrap(self, obj, method, phase):
+        original = getattr(obj, method)
+        calls = self.calls
+        seconds = self.seconds
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            result = original(*args, **kwargs)
+            seconds[phase] += perf_counter() - start
+            calls[phase] += 1
+            return result
+        self.__wrapped.append((obj, method, obj.__dict__.get(method)))
+        setattr(obj, method, timed)
+
+    def unwrapAll(self):
+        for obj, method, original in reversed(self.__wrapped):
+            if original is None:
+                delattr(obj, method)
+            else:
+                setattr(obj, method, original)
+        self.__wrapped = []
+
+    # wrap everything of game that is worth timing, env is the enviroment the game steps
+    def start(self, game, env):
+        self.wrap(env, 'step', 'env.step')
+        self.wrap(env, 'reset', 'env.reset')
+        self.wrap(game, '_SoccerGame__explore', 'epsilon')
+        self.wrap(game, '_SoccerGame__sampleAgentQValue', 'bookkeeping')
+        for role, player in (('agent', game.agent), ('opponent', game.opponent)):
+            if role == 'opponent' and player is game.agent:
+                break
+            self.players[role] = type(player).__name__
+            for method in ('act', 'learn', 'actBatch', 'learnBatch'):
+                self.wrap(player, method, role + '.' + method)
+            if hasattr(player, 'builtSolver'):
+                if player.builtSolver() is not None:
+                    self.wrapSolver(player.builtSolver(), role)
+                self.__wrapMakeSolver(player, role)
+        self.__start = perf_counter()
+
+    def wrapSolver(self, solver, role):
+        for method in ('solve', 'solveMany'):
+            self.wrap(solver, method, role + '.' + method)
+        for phase, method in getattr(solver, 'PROFILE_PHASES', {}).items():
+            self.wrap(solver, method, role + '.' + phase)
+
+    def __wrapMakeSolver(self, player, role):
+        original = player.makeSolver
+        def makeSolver():
+            solver = original()
+            self.wrapSolver(solver, role)
+            return solver
+        self.__wrapped.append((player, 'makeSolver', player.__dict__.get('makeSolver')))
+        player.makeSolver = makeSolver
+
+    def stop(self, episodes=0, steps=0):
+        self.wallSeconds += perf_counter() - self.__start
+        self.episodes += int(episodes)
+        self.steps += int(steps)
+        self.unwrapAll()
+        summary = self.summary()
+        if self.dumpPath is not None:
+            with open(self.dumpPath, 'w') as f:
+                json.dump(summary, f, indent=2)
+        if self.verbose:
+            self.report(summary)
+        return summary
+
+    def summary(self):
+        wall = self.wallSeconds
+        phases = {}
+        for phase in sorted(self.seconds, key=self.seconds.get, reverse=True):
+            phases[phase] = {
+                'calls': self.calls[phase],
+                'seconds': self.seconds[phase],
+                'meanMicroseconds': 1e6 * self.seconds[phase] / self.calls[phase],
+                'share': self.seconds[phase] / wall if wall > 0 else 0.0,
+            }
+        return {
+            'players': self.players,
+            'wallSeconds': wall,
+            'episodes': self.episodes,
+            'steps': self.steps,
+            'episodesPerSecond': self.episodes / wall if wall > 0 else 0.0,
+            'stepsPerSecond': self.steps / wall if wall > 0 else 0.0,
+            'phases': phases,
+        }
+
+    def report(self, summary=None):
+        summary = summary or self.summary()
+        print("{} vs {}: {:.2f}s, {:.1f} episodes/s, {:.1f} steps/s".format(
+            summary['players'].get('agent'), summary['players'].get('opponent', summary['players'].get('agent')),
+            summary['wallSeconds'], summary['episodesPerSecond'], summary['stepsPerSecond']))
+        print("{:<22}{:>10}{:>12}{:>12}{:>8}".format('phase', 'calls', 'seconds', 'mean (us)', 'share'))
+        for phase, stats in summary['phases'].items():
+            print("{:<22}{:>10}{:>12.3f}{:>12.1f}{:>7.1%}".format(
+                phase, stats['calls'], stats['seconds'], stats['meanMicroseconds'], stats['share']))
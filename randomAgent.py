@@ -3,13 +3,18 @@ from agents import *
 class randomPlayAgent(ISoccerGameAgent):
     def __init__(self, env, gamma):
         super().__init__(env, gamma)
-        stateSpace = env.state_space
+        numStates = env.state_space
         actSpace = env.action_space
-        dimOfQ = np.concatenate((stateSpace, [actSpace, actSpace]))
-        self.Q = np.ones(dimOfQ)
+        self.Q = np.ones((numStates, actSpace, actSpace), dtype=TABLE_DTYPE)
 
-    def act(self, s0, s1, s2):
-        return np.random.randint(self.env.action_space)
+    def act(self, s):
+        return self.rng.integers(self.env.action_space)
 
-    def learn(self, alpha, s0, s1, s2, action, opponentAction, s_prime0, s_prime1, s_prime2, reward, opponent_reward,done):
-        pass
\ No newline at end of file
+    def learn(self, alpha, s, action, opponentAction, s_prime, reward, opponent_reward, done):
+        pass
+
+    def actBatch(self, s):
+        return self.rng.integersMany(self.env.action_space, len(s))
+
+    def learnBatch(self, alpha, s, action, opponentAction, s_prime, reward, opponent_reward, done):
+        pass
@@ -0,0 +1,62 @@
+# RandomStream is the source of random numbers of one component (an enviroment, a game or an agent)
+# every component owns its own stream, a numpy Generator seeded from a SeedSequence,
+# so a run draws the same numbers no matter in which process or next to which other runs it is played
+#
+# SoccerGame(..., seed=s) spawns independent child streams of the root seed s for the game,
+# its enviroment, the agent and the opponent, see seedComponents
+# a stream created without a seed takes one from numpy's global random state,
+# so np.random.seed(s) before building the components still makes a run reproducible
+#
+# scalar draws are served from a buffered block of blockSize numbers, which is a lot cheaper
+# than one call into numpy per draw, bulk draws (randomMany, integersMany) go to the generator directly
+import numpy as np
+
+class RandomStream:
+    def __init__(self, seed=None, blockSize=1024):
+        if seed is None:
+            seed = int(np.random.randint(2**32, dtype=np.uint64))
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.seedSequence = seed
+        self.generator = np.random.Generator(np.random.PCG64(seed))
+        self.blockSize = blockSize
+        self.__block = []
+
+    # a uniform number in [0, 1)
+    def random(self):
+        if not self.__block:
+            self.__block = self.generator.random(self.blockSize).tolist()
+        return self.__block.pop()
+
+    # a uniform integer in [0, high)
+    def integers(self, high):
+        return int(self.random() * high)
+
+    def randomMany(self, size):
+        return self.generator.random(size)
+
+    def integersMany(self, high, size):
+        return self.generator.integers(high, size=size)
+
+    # n independent child streams
+    def spawn(self, n):
+        return [RandomStream(child, self.blockSize) for child in self.seedSequence.spawn(n)]
+
+    # everything needed to continue the stream exactly, as a json compatible dict
+    def getState(self):
+        return {'entropy': self.seedSequence.entropy, 'spawnKey': list(self.seedSequence.spawn_key),
+                'children': self.seedSequence.n_children_spawned,
+                'bitGenerator': self.generator.bit_generator.state, 'block': list(self.__block)}
+
+    def setState(self, state):
+        self.seedSequence = np.random.SeedSequence(state['entropy'], spawn_key=tuple(state['spawnKey']),
+                                                   n_children_spawned=state['children'])
+        self.generator = np.random.Generator(np.random.PCG64(self.seedSequence))
+        self.generator.bit_generator.state = state['bitGenerator']
+        self.__block = list(state['block'])
+
+# give each component a child stream of the root seed, in order, so the same components
+# seeded with the same root seed always get the same streams
+def seedComponents(seed, *components):
+    for component, stream in zip(components, RandomStream(seed).spawn(len(components))):
+        component.rng = stream
@@ -0,0 +1,95 @@
+# PrioritizedReplay reuses the transitions SoccerGame.train has seen, by prioritized sweeping
+# (Moore and Atkeson 1993), so Q converges in fewer episodes and fewer LP solves per episode count
+#
+# every observed transition is recorded for its (state, agent action, opponent action),
+# with how often each outcome (s_prime, reward, done) followed it, the outcomes differ by move order
+# after a real update of both players, the joint actions that lead into its state are queued with the
+# priority gamma * |change of Q|, since the value of the state they lead to has moved
+# between enviroment steps the queued joint action with the highest priority is replayed, with an
+# outcome drawn by how often it was seen, and its predecessors are queued in turn,
+# until budget backups were made or no priority is above threshold
+#
+# replayed transitions go through the unchanged learn of both players like real ones, the change of Q
+# is read from the players' Q tables, players without one (e.g. randomPlayAgent has a fixed one) give no priority
+#
+# the experience store is not part of the training checkpoints, a resumed run starts with an empty one
+import heapq
+import itertools
+import numpy as np
+from random_streams import RandomStream
+
+class PrioritizedReplay:
+    # budget is the number of replayed backups after every enviroment step
+    def __init__(self, budget=5, threshold=1e-5):
+        self.budget = budget
+        self.threshold = threshold
+        self.rng = RandomStream()
+        # (s, agentAct, opponentAct) -> {(s_prime, reward, done): count}
+        self.outcomes = {}
+        # s_prime -> the joint actions (s, agentAct, opponentAct) that led to it without ending the game
+        self.predecessors = {}
+        # a max queue with lazy deletion, an entry is only current while its priority is the one in self.priority
+        self.queue = []
+        self.priority = {}
+        self.__order = itertools.count()
+        self.numReplays = 0
+
+    @staticmethod
+    def __qValue(player, s, action, opponentAction):
+        Q = getattr(player, 'Q', None)
+        if Q is None:
+            return 0.0
+        if len(Q.shape) < 3:
+            return Q[s, action]
+        return Q[s, action, opponentAction]
+
+    # learn of both players, returns the largest change of their Q values
+    def __learn(self, agent, opponent, alpha, s, agentAct, opponentAct, s_prime, reward, done):
+        before = (self.__qValue(agent, s, agentAct, opponentAct), self.__qValue(opponent, s, opponentAct, agentAct))
+        agent.learn(alpha, s, agentAct, opponentAct, s_prime, reward, -reward, done)
+        opponent.learn(alpha, s, opponentAct, agentAct, s_prime, -reward, reward, done)
+        return max(abs(self.__qValue(agent, s, agentAct, opponentAct) - before[0]),
+                   abs(self.__qValue(opponent, s, opponentAct, agentAct) - before[1]))
+
+    def __push(self, key, priority):
+        if priority <= self.threshold or priority <= self.priority.get(key, 0.0):
+            return
+        self.priority[key] = priority
+        heapq.heappush(self.queue, (-priority, next(self.__order), key))
+
+    def __pop(self):
+        while self.queue:
+            priority, order, key = heapq.heappop(self.queue)
+            if self.priority.get(key) == -priority:
+                del self.priority[key]
+                return key
+        return None
+
+    def __queuePredecessors(self, s, change, gamma):
+        for key in self.predecessors.get(s, ()):
+            self.__push(key, gamma * change)
+
+    def __sampleOutcome(self, key):
+        outcomes = self.outcomes[key]
+        counts = np.fromiter(outcomes.values(), dtype=float, count=len(outcomes))
+        index = np.searchsorted(np.cumsum(counts), self.rng.random() * counts.sum(), side='right')
+        return list(outcomes)[min(index, len(outcomes) - 1)]
+
+    # learn a real transition, record it and replay up to budget queued backups
+    def learn(self, agent, opponent, alpha, gamma, s, agentAct, opponentAct, s_prime, reward, done):
+        key = (s, agentAct, opponentAct)
+        outcome = (s_prime, reward, done)
+        outcomes = self.outcomes.setdefault(key, {})
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        if not done:
+            self.predecessors.setdefault(s_prime, set()).add(key)
+        change = self.__learn(agent, opponent, alpha, s, agentAct, opponentAct, s_prime, reward, done)
+        self.__queuePredecessors(s, change, gamma)
+        for i in range(self.budget):
+            key = self.__pop()
+            if key is None:
+                break
+            replayState, replayReward, replayDone = self.__sampleOutcome(key)
+            change = self.__learn(agent, opponent, alpha, *key, replayState, replayReward, replayDone)
+            self.numReplays += 1
+            self.__queuePredecessors(key[0], change, gamma)
@@ -1,90 +1,211 @@
-from soccer import SoccerEnviroment
-from agents import *
-from randomAgent import randomPlayAgent
-from QlearningAgent import QLearning
-from foeQ import FoeQ
-from friendQ import FriendQ
-from ceQ import CEQ
-from matplotlib import pyplot as plt
-from game_interface import SoccerGame
-
-numEpisode = 100000
-epsilon_start = 1
-epsilon_decay = 0.99993
-epsilon_min = 0.01
-gamma = 0.99
-alpha_start = 1
-alpha_decay = 0.99993
-alpha_min = 0.001
-env = SoccerEnviroment()
-
-QLearnAgent = QLearning(env, gamma)
-QLearnOpponent = QLearning(env, gamma)
-game1 = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, QLearnAgent, QLearnOpponent)
-QLearnErr = game1.train()
-plt.plot(QLearnErr, linewidth=0.5)
-plt.show()
-
-plt.plot(QLearnErr, linewidth=0.5)
-plt.ylim(0, 0.01)
-
-FoeQAgent = FoeQ(env, gamma)
-FoeQOpponent = FoeQ(env, gamma)
-game2 = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, FoeQAgent, FoeQOpponent)
-FoeQErr = game2.train()
-plt.plot(FoeQErr, linewidth=0.5)
-plt.show()
-
-plt.plot(FoeQErr, linewidth=0.5)
-plt.ylim(0, 0.01)
-
-FriendQAgent = FriendQ(env, gamma)
-FriendQOpponent = FriendQ(env, gamma)
-game3 = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, FriendQAgent, FriendQOpponent)
-FriendQErr = game3.train()
-plt.plot(FriendQErr, linewidth=0.5)
-plt.show()
-
-plt.plot(FriendQErr, linewidth=0.5)
-plt.ylim(0, 0.01)
-
-CEQAgent = CEQ(env, gamma)
-CEQOpponent = CEQ(env, gamma)
-game4 = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, CEQAgent, CEQOpponent)
-CEQErr = game4.train()
-plt.plot(CEQErr, linewidth=0.5)
-plt.show()
-
-plt.plot(CEQErr, linewidth=0.5)
-plt.ylim(0, 0.01)
-
-CEQvsFoe = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, CEQAgent, FoeQOpponent)
-print(CEQvsFoe.evaluate())
-
-CEQvsFriend = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, CEQAgent, FriendQOpponent)
-print(CEQvsFriend.evaluate())
-
-FoevsFriend = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, FoeQAgent, FriendQOpponent)
-print(FoevsFriend.evaluate())
-
-FriendvsFoe = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, FriendQAgent, FoeQOpponent)
-print(FriendvsFoe.evaluate())
-
-CEQvsQLearn = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, CEQAgent, QLearnOpponent)
-print(CEQvsQLearn.evaluate())
-
-FoeQvsQLearn = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, FoeQAgent, QLearnOpponent)
-print(FoeQvsQLearn.evaluate())
-
-FriendQvsQLearn = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, FriendQAgent, QLearnOpponent)
-print(FriendQvsQLearn.evaluate())
-
-randomAgent= randomPlayAgent(env, gamma)
-CEQvsRandom = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, CEQAgent, randomAgent)
-print("CEQ vs Random: ", CEQvsRandom.evaluate())
-FoeQvsRandom = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, FoeQAgent, randomAgent)
-print("FoeQ vs Random: ", FoeQvsRandom.evaluate())
-FriendQvsRandom = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, FriendQAgent, randomAgent)
-print("FriendQ vs Random: ", FriendQvsRandom.evaluate())
-QLearnvsRandom = SoccerGame(numEpisode, alpha_start, alpha_decay, alpha_min, epsilon_start, epsilon_decay, epsilon_min, gamma, env, QLearnAgent, randomAgent)
-print("QLearn vs Random: ", QLearnvsRandom.evaluate())
\ No newline at end of file
+# runs an experiment of training runs and matchups from a sweep spec, headless, on local worker processes
+#
+#   python run_game.py                            the experiment of the paper, see DEFAULT_SPEC
+#   python run_game.py sweep.json --output runs/sweep --workers 8
+#   python run_game.py --write-spec sweep.json    writes DEFAULT_SPEC as a starting point
+#
+# a spec is a json dict with
+#   agents:     name -> agent type (see evaluation.AGENTS) or {'agent': type, 'agentArgs': {...}}
+#   params:     SoccerGame parameters for every run, on top of parallel_runner.DEFAULT_PARAMS
+#   grid:       parameter -> list of values, every combination is a grid point
+#   seeds:      the root seeds, every agent is trained once per grid point and seed
+#   matchups:   [agent, opponent] pairs of agent names or 'Random', played at every grid point and seed
+#               with the agent of one run against the opponent of the other, as ParallelRunner.evaluate does
+#   evaluation: numGames and ciWidth of every matchup, see Evaluator
+#
+# everything is written to the output directory
+#   runs/<run>/agent.ckpt, opponent.ckpt    the trained players, see ISoccerGameAgent.save
+#   runs/<run>/error.npy                    the error curve
+#   runs/<run>/done.json                    the job and seed of the run, written last
+#   plots/<run>.png                         the error curve, full scale and zoomed in as in the paper
+#   evaluation.json                         the result and config of every matchup
+# a run counts as finished when its done.json holds the same job and seed, and a matchup when
+# evaluation.json holds it with the same runs and evaluation settings, so running the same spec again
+# only does what is missing or changed
+import argparse
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from checkpoint import saveArrays
+from evaluation import AGENTS, Evaluator
+from parallel_runner import DEFAULT_PARAMS, runTraining
+
+DEFAULT_SPEC = {
+    'agents': {'QLearning': 'QLearning', 'FoeQ': 'FoeQ', 'FriendQ': 'FriendQ', 'CEQ': 'CEQ'},
+    'params': {},
+    'grid': {},
+    'seeds': [0],
+    'matchups': [['CEQ', 'FoeQ'], ['CEQ', 'FriendQ'], ['FoeQ', 'FriendQ'], ['FriendQ', 'FoeQ'],
+                 ['CEQ', 'QLearning'], ['FoeQ', 'QLearning'], ['FriendQ', 'QLearning'],
+                 ['CEQ', 'Random'], ['FoeQ', 'Random'], ['FriendQ', 'Random'], ['QLearning', 'Random']],
+    'evaluation': {'numGames': 10000, 'ciWidth': None},
+}
+
+def loadSpec(path):
+    with open(path) as f:
+        spec = dict(DEFAULT_SPEC, **json.load(f))
+    for agent, opponent in spec['matchups']:
+        for name in (agent, opponent):
+            if name != 'Random' and name not in spec['agents']:
+                raise ValueError("matchup {} vs {} uses the unknown agent {}".format(agent, opponent, name))
+    return spec
+
+# the grid points of a spec as (key, params), the key names the point in files
+def gridPoints(spec):
+    names = sorted(spec['grid'])
+    for values in itertools.product(*[spec['grid'][name] for name in names]):
+        point = dict(zip(names, values))
+        key = '_'.join("{}={}".format(name, json.dumps(value, separators=(',', ':'))) for name, value in point.items())
+        yield key or 'default', dict(spec['params'], **point)
+
+# every training run of a spec, run name -> {'job', 'seed', 'point'}
+def expandRuns(spec):
+    runs = {}
+    for point, params in gridPoints(spec):
+        for seed in spec['seeds']:
+            for name, agent in spec['agents'].items():
+                job = {'agent': agent, 'agentArgs': None} if isinstance(agent, str) else dict(agent)
+                if job['agent'] not in AGENTS:
+                    raise ValueError("unknown agent type {}".format(job['agent']))
+                job['params'] = params
+                runs["{}_{}_seed{}".format(name, point, seed)] = {'job': job, 'seed': seed, 'point': point}
+    return runs
+
+class ExperimentRunner:
+    # numWorkers=None uses one worker per cpu
+    def __init__(self, spec, output, numWorkers=None, plots=True):
+        self.spec = spec
+        self.output = output
+        self.numWorkers = numWorkers
+        self.plots = plots
+        self.runs = expandRuns(spec)
+
+    def __runDir(self, run):
+        return os.path.join(self.output, 'runs', run)
+
+    def isFinished(self, run):
+        path = os.path.join(self.__runDir(run), 'done.json')
+        if not os.path.exists(path):
+            return False
+        with open(path) as f:
+            done = json.load(f)
+        return done['job'] == self.runs[run]['job'] and done['seed'] == self.runs[run]['seed']
+
+    def __save(self, run, result):
+        directory = self.__runDir(run)
+        os.makedirs(directory, exist_ok=True)
+        agentType = AGENTS[self.runs[run]['job']['agent']].__name__
+        for role in ('agent', 'opponent'):
+            saveArrays(os.path.join(directory, role + '.ckpt'), result[role], {'agent': agentType})
+        np.save(os.path.join(directory, 'error.npy'), result['error'])
+        with open(os.path.join(directory, 'done.json'), 'w') as f:
+            json.dump({'job': self.runs[run]['job'], 'seed': self.runs[run]['seed']}, f, indent=1)
+        if self.plots:
+            self.plot(run, result['error'])
+
+    # trains the runs that are not finished, each is saved as soon as it is done
+    def train(self):
+        pending = [run for run in self.runs if not self.isFinished(run)]
+        print("{} of {} runs finished, training {}".format(len(self.runs) - len(pending), len(self.runs), len(pending)))
+        if not pending:
+            return
+        with ProcessPoolExecutor(self.numWorkers) as pool:
+            futures = {pool.submit(runTraining, self.runs[run]['job'], self.runs[run]['seed']): run for run in pending}
+            for future in as_completed(futures):
+                self.__save(futures[future], future.result())
+                print("finished {}".format(futures[future]))
+
+    def plot(self, run, error):
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib import pyplot as plt
+        os.makedirs(os.path.join(self.output, 'plots'), exist_ok=True)
+        figure, (full, zoomed) = plt.subplots(1, 2, figsize=(12, 4))
+        for axes in (full, zoomed):
+            axes.plot(error, linewidth=0.5)
+            axes.set_xlabel('episode')
+            axes.set_ylabel('Q value difference')
+        zoomed.set_ylim(0, 0.01)
+        figure.suptitle(run)
+        figure.savefig(os.path.join(self.output, 'plots', run + '.png'), dpi=100)
+        plt.close(figure)
+
+    def __loadEvaluation(self):
+        path = os.path.join(self.output, 'evaluation.json')
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def __saveEvaluation(self, evaluation):
+        path = os.path.join(self.output, 'evaluation.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(evaluation, f, indent=1, sort_keys=True)
+        os.replace(path + '.tmp', path)
+
+    # plays the matchups that are not in evaluation.json with the same config yet,
+    # the players are memory mapped from their runs
+    # the config of a matchup is the job and seed of the runs of both players and the evaluation settings,
+    # so a matchup is played again when one of its players was retrained or the settings changed
+    def evaluate(self):
+        evaluation = self.__loadEvaluation()
+        settings = self.spec['evaluation']
+        for point, params in gridPoints(self.spec):
+            params = dict(DEFAULT_PARAMS, **params)
+            def run(name, seed):
+                return None if name == 'Random' else "{}_{}_seed{}".format(name, point, seed)
+            def player(name, seed, role):
+                if name == 'Random':
+                    return ('Random', None, None)
+                job = self.runs[run(name, seed)]['job']
+                return (job['agent'], job.get('agentArgs'), os.path.join(self.__runDir(run(name, seed)), role + '.ckpt'))
+            matchups = {}
+            configs = {}
+            for seed in self.spec['seeds']:
+                for agent, opponent in self.spec['matchups']:
+                    name = "{} vs {}_{}_seed{}".format(agent, opponent, point, seed)
+                    configs[name] = {'agent': self.runs.get(run(agent, seed)), 'opponent': self.runs.get(run(opponent, seed)),
+                                     'numGames': settings.get('numGames', 10000), 'ciWidth': settings.get('ciWidth')}
+                    if evaluation.get(name, {}).get('config') != configs[name]:
+                        matchups[name] = (player(agent, seed, 'agent'), player(opponent, seed, 'opponent'))
+            if not matchups:
+                continue
+            evaluator = Evaluator(self.numWorkers, maxGames=settings.get('numGames', 10000),
+                                  ciWidth=settings.get('ciWidth'), gamma=params['gamma'],
+                                  maxStep=params['maxStep'], field=params['field'])
+            for name, result in evaluator.evaluate(matchups).items():
+                evaluation[name] = {'wins': result.wins, 'numGames': result.numGames,
+                                    'winRate': result.winRate, 'ci': list(result.ci), 'config': configs[name]}
+                print("{}: {}".format(name, result))
+            self.__saveEvaluation(evaluation)
+        return evaluation
+
+    def run(self):
+        self.train()
+        return self.evaluate()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='train and evaluate the players of a sweep spec')
+    parser.add_argument('spec', nargs='?', help='the sweep spec, a json file, the experiment of the paper without it')
+    parser.add_argument('--output', default='experiment', help='directory for runs, plots and results')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, one per cpu by default')
+    parser.add_argument('--episodes', type=int, default=None, help='override numEpisode of every run')
+    parser.add_argument('--no-plots', action='store_true', help='do not plot the error curves')
+    parser.add_argument('--write-spec', metavar='PATH', help='write the default spec to PATH and exit')
+    args = parser.parse_args(argv)
+
+    if args.write_spec:
+        with open(args.write_spec, 'w') as f:
+            json.dump(DEFAULT_SPEC, f, indent=2)
+        return 0
+    spec = loadSpec(args.spec) if args.spec else dict(DEFAULT_SPEC)
+    if args.episodes is not None:
+        spec['params'] = dict(spec['params'], numEpisode=args.episodes)
+    ExperimentRunner(spec, args.output, args.workers, not args.no_plots).run()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
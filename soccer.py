@@ -3,49 +3,136 @@
 # Use step(actionA, actionB) to simulate an action which returns next stata, reward and isFinished
 # Use render() to draw the current state
 # self.action_space: num of actions
-# self.state_space: <num of variabel1, num of variable2, num of variable3>
+# self.state_space: num of states, a state is a single integer id, see SoccerField.encodeState
+# self.state_shape: <num of variabel1, num of variable2, num of variable3> the state id is made of
 
-# the fild is a 2x4 grid
+# the field is a grid described by a SoccerField, by default the 2x4 grid of the paper
 # number the grid as
 # 0, 1, 2, 3
 # 4, 5, 6, 7
 # states are position of A, position of B and whether A or B has the ball
 # actions for both A and B are (N,S,E,W,stick) which is represented as 0~4
+
+# with useTable=True, step() looks the result up in a precomputed TransitionTable
+# instead of moving the players, it draws the same random numbers and returns the same output
+# random numbers come from the enviroment's own RandomStream self.rng, see random_streams.py
 import numpy as np
+from random_streams import RandomStream
 GOAL_REWARD = 100
 
-class SoccerEnviroment:
+# SoccerField describes the grid the game is played on
+# rows x columns cells numbered row by row, a player that moves into a wall sticks
+# goalColumns = (goal of A, goal of B): the ball carried into the first column scores for A,
+# into the second column for B, by default the first and the last column
+# spawn: the cells players start on, by default every cell outside the goal columns
+class SoccerField:
+    # (row, column) offsets of N, S, E, W and stick
+    OFFSETS = ((-1, 0), (1, 0), (0, 1), (0, -1), (0, 0))
+
+    def __init__(self, rows=2, columns=4, goalColumns=None, spawn=None):
+        self.rows = rows
+        self.columns = columns
+        self.numCells = rows * columns
+        self.goalColumns = tuple(goalColumns) if goalColumns is not None else (0, columns - 1)
+        if spawn is None:
+            spawn = [cell for cell in range(self.numCells) if cell % columns not in self.goalColumns]
+        self.spawn = list(spawn)
+        if len(self.spawn) < 2:
+            raise ValueError("a field needs at least 2 spawn cells, got {}".format(self.spawn))
+        # moves[cell, action] is the cell a player ends up in
+        row, column = np.divmod(np.arange(self.numCells), columns)
+        self.moves = np.zeros((self.numCells, len(self.OFFSETS)), dtype=int)
+        for action, (dr, dc) in enumerate(self.OFFSETS):
+            inside = (row + dr >= 0) & (row + dr < rows) & (column + dc >= 0) & (column + dc < columns)
+            self.moves[:, action] = np.where(inside, (row + dr) * columns + column + dc, np.arange(self.numCells))
+        self.numStates = self.numCells * self.numCells * 2
+
+    # fields with the same key have the same transitions, the spawn cells only matter for reset
+    def key(self):
+        return (self.rows, self.columns, self.goalColumns)
+
+    # the enviroment and the agents represent a state by a single integer id
+    # s = (posOfA * numCells + posOfB) * 2 + AHasBall, which gives 8x8x2 = 128 states on the 2x4 field
+    # works on numbers and on arrays
+    def encodeState(self, posOfA, posOfB, AHasBall):
+        return (posOfA * self.numCells + posOfB) * 2 + AHasBall
+
+    # returns (posOfA, posOfB, AHasBall) of a state id
+    def decodeState(self, s):
+        return s // (2 * self.numCells), s // 2 % self.numCells, s % 2 == 1
+
+    # the reward for A when the ball is on a cell, the reward for B is the negative
+    def goalReward(self, posWithBall):
+        column = posWithBall % self.columns
+        return np.where(column == self.goalColumns[0], GOAL_REWARD,
+                        np.where(column == self.goalColumns[1], -GOAL_REWARD, 0))
+
+DEFAULT_FIELD = SoccerField()
+
+# state ids of the default 2x4 field
+def encodeState(posOfA, posOfB, AHasBall):
+    return DEFAULT_FIELD.encodeState(posOfA, posOfB, AHasBall)
 
-    def __init__(self):
-        self.actions = [-4, 4, 1, -1, 0]
-        self.action_space = len(self.actions)
-        self.state_space = (8, 8, 2)
+def decodeState(s):
+    return DEFAULT_FIELD.decodeState(s)
 
-    def __showCurrentState(self):
-        return (self.posOfA, self.posOfB, self.AHasBall)
+# TransitionTable holds the outcome of every step of the game
+# nextState, reward and done are indexed by [state, actionOfA, actionOfB, moveOrder]
+# where state is the state id and moveOrder is 1 if A moves first, 0 otherwise
+# posOfA, posOfB and AHasBall are indexed by state and decode the state id
+# every table uses the smallest dtype that holds its values, so larger fields stay small
+class TransitionTable:
+    def __init__(self, numStates, numActions, numCells):
+        shape = (numStates, numActions, numActions, 2)
+        self.numStates = numStates
+        self.nextState = np.zeros(shape, dtype=np.min_scalar_type(numStates - 1))
+        self.reward = np.zeros(shape, dtype=np.int8)
+        self.done = np.zeros(shape, dtype=bool)
+        cellType = np.min_scalar_type(numCells - 1)
+        self.posOfA = np.zeros(numStates, dtype=cellType)
+        self.posOfB = np.zeros(numStates, dtype=cellType)
+        self.AHasBall = np.zeros(numStates, dtype=bool)
+
+# one move of a player given as arrays: it moves unless the other player is in the way,
+# running into the other player hands the ball over if the mover has it
+def _moveArrays(moves, pos, otherPos, action, hasBall):
+    newPos = moves[pos, action]
+    blocked = newPos == otherPos
+    return np.where(blocked, pos, newPos), hasBall & ~blocked
+
+class SoccerEnviroment:
+    # the transition tables are the same for all instances on the same field,
+    # each is built once on first use and kept by SoccerField.key
+    transitionTables = {}
+
+    def __init__(self, useTable=False, rng=None, field=None):
+        self.rng = rng or RandomStream()
+        self.field = field or DEFAULT_FIELD
+        self.action_space = len(SoccerField.OFFSETS)
+        self.state_shape = (self.field.numCells, self.field.numCells, 2)
+        self.state_space = self.field.numStates
+        self.useTable = useTable
+        # nested lists are faster than numpy for scalar lookups
+        self.__moves = self.field.moves.tolist()
+        if useTable:
+            self.table = self.getTransitionTable()
+            self.__nextState = self.table.nextState.tolist()
+            self.__reward = self.table.reward.tolist()
 
     # returns the reward for A, the reward for B is the negative by definition of zero sum game
     def __calculateReward(self):
-        if self.AHasBall:
-            if self.posOfA == 0 or self.posOfA == 4:
-                return GOAL_REWARD
-            if self.posOfA == 3 or self.posOfA == 7:
-                return -GOAL_REWARD
-        else:
-            if self.posOfB == 0 or self.posOfB == 4:
-                return GOAL_REWARD
-            if self.posOfB == 3 or self.posOfB == 7:
-                return -GOAL_REWARD
+        posWithBall = self.posOfA if self.AHasBall else self.posOfB
+        column = posWithBall % self.field.columns
+        if column == self.field.goalColumns[0]:
+            return GOAL_REWARD
+        if column == self.field.goalColumns[1]:
+            return -GOAL_REWARD
         return 0
 
     # calculate the postion of a player after a move
     # player sticks if moving towards a wall
     def __movePlayer(self, postion, action):
-        newPostion = postion + self.actions[action]
-        if newPostion < 0 or newPostion > 7:
-            return postion
-        else:
-            return newPostion
+        return self.__moves[postion][action]
 
     def __moveA(self, actionOfA):
         newPosOfA = self.__movePlayer(self.posOfA, actionOfA)
@@ -63,16 +150,8 @@ class SoccerEnviroment:
         elif not self.AHasBall:
             self.AHasBall = True
 
-    # initilized game with random ball poccession
-    def reset(self):
-        self.posOfA, self.posOfB = np.random.choice([1,2,5,6], size=2, replace=False)
-        self.AHasBall = np.random.choice([True, False])
-        return self.__showCurrentState()
-
-    # take a step in the game given actions of A and B
-    # return next state, reward and whether the game is dones
-    def step(self, actionOfA, actionOfB):
-        if np.random.random() > 0.5:
+    def __moveBoth(self, actionOfA, actionOfB, AFirst):
+        if AFirst:
             # A moves first
             self.__moveA(actionOfA)
             self.__moveB(actionOfB)
@@ -81,14 +160,73 @@ class SoccerEnviroment:
             self.__moveB(actionOfB)
             self.__moveA(actionOfA)
 
-        reward = self.__calculateReward()
-        return self.__showCurrentState(), reward, not reward == 0
+    # play every action pair in both move orders from every state at once, with the same rules as __moveBoth
+    # states where A and B share a cell cannot happen, they are left pointing to themselves
+    def __buildTransitionTable(self):
+        field = self.field
+        numActions = self.action_space
+        table = TransitionTable(field.numStates, numActions, field.numCells)
+        states = np.arange(field.numStates)
+        table.posOfA[:], table.posOfB[:], table.AHasBall[:] = field.decodeState(states)
+        # arrays of shape (states, actionOfA, actionOfB)
+        posOfA, posOfB, AHasBall = field.decodeState(states[:, None, None])
+        actionOfA = np.arange(numActions)[None, :, None]
+        actionOfB = np.arange(numActions)[None, None, :]
+        valid = posOfA != posOfB
+        for AFirst in (0, 1):
+            if AFirst:
+                newA, ball = _moveArrays(field.moves, posOfA, posOfB, actionOfA, AHasBall)
+                newB, BHasBall = _moveArrays(field.moves, posOfB, newA, actionOfB, ~ball)
+                ball = ~BHasBall
+            else:
+                newB, BHasBall = _moveArrays(field.moves, posOfB, posOfA, actionOfB, ~AHasBall)
+                newA, ball = _moveArrays(field.moves, posOfA, newB, actionOfA, ~BHasBall)
+            reward = np.where(valid, field.goalReward(np.where(ball, newA, newB)), 0)
+            table.nextState[..., AFirst] = np.where(valid, field.encodeState(newA, newB, ball), states[:, None, None])
+            table.reward[..., AFirst] = reward
+            table.done[..., AFirst] = reward != 0
+        return table
+
+    def getTransitionTable(self):
+        key = self.field.key()
+        if key not in SoccerEnviroment.transitionTables:
+            SoccerEnviroment.transitionTables[key] = self.__buildTransitionTable()
+        return SoccerEnviroment.transitionTables[key]
+
+    # initilized game with random ball poccession
+    # returns the id of the start state
+    def reset(self):
+        # draw two different spawn cells, B is drawn from the cells A did not take
+        spawn = self.field.spawn
+        indexOfA = self.rng.integers(len(spawn))
+        indexOfB = self.rng.integers(len(spawn) - 1)
+        indexOfB += indexOfB >= indexOfA
+        self.posOfA, self.posOfB = spawn[indexOfA], spawn[indexOfB]
+        self.AHasBall = self.rng.random() < 0.5
+        self.state = int(self.field.encodeState(self.posOfA, self.posOfB, self.AHasBall))
+        return self.state
+
+    # take a step in the game given actions of A and B
+    # return the id of the next state, reward and whether the game is dones
+    def step(self, actionOfA, actionOfB):
+        AFirst = self.rng.random() > 0.5
+        if self.useTable:
+            moveOrder = int(AFirst)
+            reward = self.__reward[self.state][actionOfA][actionOfB][moveOrder]
+            self.state = self.__nextState[self.state][actionOfA][actionOfB][moveOrder]
+        else:
+            self.__moveBoth(actionOfA, actionOfB, AFirst)
+            reward = self.__calculateReward()
+            self.state = int(self.field.encodeState(self.posOfA, self.posOfB, self.AHasBall))
+        return self.state, reward, not reward == 0
 
     def render(self):
-        out = "---------------------\n"
-        for i in range(2):
-            for j in range(4):
-                position = i * 4 + j
+        self.posOfA, self.posOfB, self.AHasBall = self.field.decodeState(self.state)
+        line = "-" * (5 * self.field.columns + 1) + "\n"
+        out = line
+        for i in range(self.field.rows):
+            for j in range(self.field.columns):
+                position = i * self.field.columns + j
                 if self.posOfA == position:
                     if self.AHasBall:
                         out += "| A* "
@@ -101,6 +239,58 @@ class SoccerEnviroment:
                         out += "| B  "
                 else:
                     out += "|    "
-            out += "|\n---------------------\n"
+            out += "|\n" + line
         print(out)
-    
\ No newline at end of file
+
+
+# BatchSoccerEnviroment runs n independent soccer games in lock-step
+# the rules are the same as SoccerEnviroment, the games are kept as an array of state indices
+# and one call to step looks up all n games in the TransitionTable at once
+# Use reset() to initiate all n games
+# Use step(actionsOfA, actionsOfB) with two arrays of n actions, which returns arrays of
+# next state ids, rewards for A and whether each game is done
+# games that are done are reset automatically, so the next state returned for them
+# is already the start state of their next episode
+class BatchSoccerEnviroment:
+
+    def __init__(self, n, rng=None, field=None):
+        self.n = n
+        self.rng = rng or RandomStream()
+        env = SoccerEnviroment(rng=self.rng, field=field)
+        self.field = env.field
+        self.action_space = env.action_space
+        self.state_space = env.state_space
+        self.state_shape = env.state_shape
+        self.spawn = np.array(self.field.spawn)
+        self.table = env.getTransitionTable()
+
+    # re-initilize the games selected by mask with random positions and ball poccession
+    def __resetGames(self, mask):
+        num = np.count_nonzero(mask)
+        if num == 0:
+            return
+        # draw two different spawn cells per game, B is drawn from the cells A did not take
+        indexOfA = self.rng.integersMany(len(self.spawn), num)
+        indexOfB = self.rng.integersMany(len(self.spawn) - 1, num)
+        indexOfB += indexOfB >= indexOfA
+        AHasBall = self.rng.randomMany(num) < 0.5
+        self.state[mask] = self.field.encodeState(self.spawn[indexOfA], self.spawn[indexOfB], AHasBall)
+
+    # with mask only the selected games are reset, and the state ids of all games are returned
+    def reset(self, mask=None):
+        if mask is None:
+            self.state = np.zeros(self.n, dtype=int)
+            mask = np.ones(self.n, dtype=bool)
+        self.__resetGames(mask)
+        return self.state
+
+    # take a step in all games given arrays of actions of A and B
+    # return next states, rewards for A and whether each game is done
+    def step(self, actionsOfA, actionsOfB):
+        AFirst = (self.rng.randomMany(self.n) > 0.5).astype(int)
+        key = (self.state, actionsOfA, actionsOfB, AFirst)
+        self.state = self.table.nextState[key].astype(int)
+        reward = self.table.reward[key].astype(int)
+        done = self.table.done[key]
+        self.__resetGames(done)
+        return self.state, reward, done
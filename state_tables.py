@@ -0,0 +1,84 @@
+# LazyStateTable is a table indexed by state first, like the numpy tables of the agents, that only
+# allocates memory for the states that were written to
+# on larger fields most states are never visited (e.g. both players on the same cell), with
+# ISoccerGameAgent(..., sparse=True) every table of an agent is a LazyStateTable and only the visited
+# states cost memory
+#
+# the blocks of the states live in one pool array, slot 0 of the pool holds the initial value
+# every state starts with and is never written, so reading an unvisited state is a plain lookup
+# the table supports the indexing the agents use, table[s], table[s, a, o] and the same with arrays of states,
+# reads return numpy arrays (views of the pool for a single state) and writes go through the table,
+# a read of an unvisited state is a view of the shared initial block and must not be written to
+import numpy as np
+
+class LazyStateTable:
+    def __init__(self, numStates, blockShape, fill=0.0, dtype=np.float64, capacity=64):
+        self.shape = (numStates,) + tuple(blockShape)
+        self.ndim = len(self.shape)
+        self.dtype = np.dtype(dtype)
+        self.fill = fill
+        self.index = np.zeros(numStates, dtype=np.int32)
+        self.blocks = np.full((capacity,) + tuple(blockShape), fill, dtype=dtype)
+        self.numBlocks = 1
+
+    def __len__(self):
+        return self.shape[0]
+
+    @staticmethod
+    def __split(key):
+        if isinstance(key, tuple):
+            return key[0], key[1:]
+        return key, ()
+
+    def __getitem__(self, key):
+        s, rest = self.__split(key)
+        return self.blocks[(self.index[s],) + rest]
+
+    def __setitem__(self, key, value):
+        s, rest = self.__split(key)
+        self.__allocate(s)
+        self.blocks[(self.index[s],) + rest] = value
+
+    def __allocate(self, s):
+        if np.ndim(s) == 0:
+            if self.index[s] != 0:
+                return
+            new = np.array([s])
+        else:
+            new = np.unique(np.asarray(s)[self.index[s] == 0])
+            if len(new) == 0:
+                return
+        if self.numBlocks + len(new) > len(self.blocks):
+            grown = np.full((max(2 * len(self.blocks), self.numBlocks + len(new)),) + self.shape[1:],
+                            self.fill, dtype=self.dtype)
+            grown[:self.numBlocks] = self.blocks[:self.numBlocks]
+            self.blocks = grown
+        self.index[new] = np.arange(self.numBlocks, self.numBlocks + len(new))
+        self.numBlocks += len(new)
+
+    # the number of states that have their own block
+    def numAllocated(self):
+        return self.numBlocks - 1
+
+    # bytes in use, the pool grows by doubling so it can hold up to twice the allocated blocks
+    @property
+    def nbytes(self):
+        return self.blocks.nbytes + self.index.nbytes
+
+    # bytes a dense numpy table of the same shape would take
+    def denseNbytes(self):
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    # the dense table, e.g. to save it
+    def __array__(self, dtype=None, copy=None):
+        dense = self.blocks[self.index]
+        return dense if dtype is None else dense.astype(dtype)
+
+# bytes used by the tables of an agent, dense or lazy, and by the caches it keeps per state,
+# its sampler and the policy cache of a lazy agent
+def tableMemory(agent):
+    memory = {name: int(table.nbytes) for name, table in agent.getTables().items()}
+    for name in ('sampler', 'policyCache'):
+        if getattr(agent, name, None) is not None:
+            memory[name] = int(getattr(agent, name).nbytes)
+    return memory
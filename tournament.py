@@ -0,0 +1,147 @@
+# Tournament plays the full round robin of a set of agents on a pool of worker processes, see Evaluator
+# every ordered pairing is a matchup, the first player plays A and the second plays B, so both
+# sides of every pairing are played
+# tables are laid out from the point of view of the side they were trained on (A's goal and A's own
+# action first), so a player has tables for each side, like the agent and opponent of a training job
+# a player is given as (agentType, agentArgs, {'agent': tables or checkpoint path, 'opponent': ...}),
+# the agent tables play A and the opponent tables play B, a player without tables (e.g. 'Random') gives None
+# every side of a player has its own version, a hash of its type, arguments and tables (or checkpoint file),
+# so a retrained agent is a new player
+#
+# results are cached in a json file keyed by the versions of both players and the evaluation settings,
+# a league that only retrained some agents just replays the pairings they are in
+# a matchup is seeded from the versions of its players, so a cached result is the same
+# as the one replaying it would give
+#
+# ratings are fit with the Bradley-Terry model on the games of both sides of every pairing,
+# a game the agent does not win (also a draw after maxStep) counts for the opponent,
+# since every pairing is played from both sides this evens out, ratings are on the Elo scale around 1500
+import hashlib
+import json
+import os
+import numpy as np
+from evaluation import Evaluator, makeField
+
+# the player of one side for the Evaluator, (agentType, agentArgs, tables or checkpoint path)
+def playerSide(player, role):
+    agentType, agentArgs, tables = player
+    return (agentType, agentArgs, None if tables is None else tables[role])
+
+# a short hash of everything that decides how one side of a player plays, see playerSide
+def playerVersion(player):
+    agentType, agentArgs, tables = player
+    digest = hashlib.sha1(json.dumps([agentType, agentArgs or {}], sort_keys=True).encode())
+    if isinstance(tables, str):
+        with open(tables, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    elif tables is not None:
+        for name in sorted(tables):
+            table = np.ascontiguousarray(tables[name])
+            digest.update(name.encode())
+            digest.update(table.dtype.str.encode())
+            digest.update(str(table.shape).encode())
+            digest.update(table.tobytes())
+    return digest.hexdigest()[:16]
+
+# Bradley-Terry strengths of the players from wins[i, j], the games i won against j,
+# fit with the minorization-maximization updates, every pairing starts with half a win for each
+# side so a player that won or lost everything still gets a finite rating
+def bradleyTerry(wins, iterations=1000, tolerance=1e-10):
+    n = len(wins)
+    wins = wins + 0.5 * (1 - np.eye(n))
+    games = wins + wins.T
+    strength = np.ones(n)
+    for i in range(iterations):
+        previous = strength
+        strength = wins.sum(axis=1) / np.sum(games / (strength[:, None] + strength[None, :]), axis=1)
+        strength /= np.exp(np.mean(np.log(strength)))
+        if np.max(np.abs(strength - previous)) < tolerance:
+            break
+    return 1500 + 400 * np.log10(strength)
+
+class TournamentResult:
+    # winRate[i, j] and numGames[i, j] are the win rate and games of names[i] playing A against names[j]
+    def __init__(self, names, wins, numGames, replayed):
+        self.names = names
+        self.wins = wins
+        self.numGames = numGames
+        self.winRate = np.divide(wins, numGames, out=np.full(wins.shape, np.nan), where=numGames > 0)
+        # wins of each side of a pairing, a game i played as B against j is won by i when j did not win it
+        self.ratings = dict(zip(names, bradleyTerry(wins + (numGames - wins).T)))
+        # the matchups that were played, the others came from the cache
+        self.replayed = replayed
+
+    def __repr__(self):
+        width = max(len(name) for name in self.names)
+        lines = [" " * width + "".join(" {:>9}".format(name[:9]) for name in self.names)]
+        for i, name in enumerate(self.names):
+            lines.append("{:>{}}".format(name, width) +
+                         "".join("         -" if i == j else " {:9.4f}".format(self.winRate[i, j])
+                                 for j in range(len(self.names))))
+        lines.append("")
+        for name, rating in sorted(self.ratings.items(), key=lambda item: -item[1]):
+            lines.append("{:>{}} {:7.1f}".format(name, width, rating))
+        return "\n".join(lines)
+
+class Tournament:
+    # cachePath=None keeps no results between runs
+    # numGames, ciWidth and the game settings are passed to the Evaluator, see Evaluator
+    def __init__(self, numWorkers=None, seed=0, cachePath=None, numGames=1000, ciWidth=None,
+                 gamma=0.99, maxStep=500, field=None):
+        self.numWorkers = numWorkers
+        self.seed = seed
+        self.cachePath = cachePath
+        self.numGames = numGames
+        self.ciWidth = ciWidth
+        self.gamma = gamma
+        self.maxStep = maxStep
+        self.field = field
+
+    def __settings(self):
+        field = makeField(self.field)
+        return json.dumps([self.seed, self.numGames, self.ciWidth, self.gamma, self.maxStep,
+                           list(field.key()) if field is not None else None])
+
+    def __loadCache(self):
+        if self.cachePath is None or not os.path.exists(self.cachePath):
+            return {}
+        with open(self.cachePath) as f:
+            return json.load(f)
+
+    # written to a temporary name and renamed, like the checkpoints
+    def __saveCache(self, cache):
+        if self.cachePath is None:
+            return
+        tmpPath = self.cachePath + '.tmp'
+        with open(tmpPath, 'w') as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+        os.replace(tmpPath, self.cachePath)
+
+    # players maps a name to a player, returns a TournamentResult
+    def run(self, players):
+        names = list(players)
+        sides = {(name, role): playerSide(player, role) for name, player in players.items()
+                 for role in ('agent', 'opponent')}
+        versions = {side: playerVersion(player) for side, player in sides.items()}
+        settings = self.__settings()
+        cache = self.__loadCache()
+        # the matchup name seeds its games, so it only depends on the players and not on their names
+        keys = {(agent, opponent): "{}:{}".format(versions[agent, 'agent'], versions[opponent, 'opponent'])
+                for agent in names for opponent in names if agent != opponent}
+        missing = {key: (sides[agent, 'agent'], sides[opponent, 'opponent'])
+                   for (agent, opponent), key in keys.items() if key not in cache.get(settings, {})}
+        if missing:
+            evaluator = Evaluator(self.numWorkers, self.seed, maxGames=self.numGames, ciWidth=self.ciWidth,
+                                  gamma=self.gamma, maxStep=self.maxStep, field=self.field)
+            results = evaluator.evaluate(missing)
+            cache.setdefault(settings, {}).update(
+                {key: [result.wins, result.numGames] for key, result in results.items()})
+            self.__saveCache(cache)
+        wins = np.zeros((len(names), len(names)), dtype=np.int64)
+        numGames = np.zeros_like(wins)
+        for (agent, opponent), key in keys.items():
+            i, j = names.index(agent), names.index(opponent)
+            wins[i, j], numGames[i, j] = cache[settings][key]
+        replayed = [pairing for pairing, key in keys.items() if key in missing]
+        return TournamentResult(names, wins, numGames, replayed)
@@ -0,0 +1,231 @@
+# checks that the fast paths of the game give the results of the code they replace
+#
+#   python validation.py
+#   python validation.py --only solvers
+#
+# every check is seeded, it prints what does not match and the exit code is 1 if anything does not
+# solvers: MinimaxSimplexSolver.solve and solveMany against MinimaxLPSolver on random games and on
+#          degenerate integer games (ties, constant and duplicate rows and columns), where the policies
+#          may differ, so the value and the payoff the policy guarantees are compared
+# step:    SoccerEnviroment(useTable=True) against the moving players of useTable=False, from the same
+#          RandomStream on the field of the paper and a larger one, every output of reset and step and the
+#          random numbers left in the stream must be identical
+# ce:      CEConstraintBuilder.build and rationality of stacks of games against the loops CEQ built its LP with,
+#          the matrices must be identical
+# resume:  SoccerGame.train resumed from a checkpoint halfway against the same run without one,
+#          for every agent type and the lazy agents, the tables and error curves must be identical
+import argparse
+import os
+import sys
+import tempfile
+import numpy as np
+from soccer import SoccerEnviroment, SoccerField
+from random_streams import RandomStream
+from game_interface import SoccerGame
+from metrics import MetricsSink, ErrorCurve
+from QlearningAgent import QLearning
+from friendQ import FriendQ
+from foeQ import FoeQ
+from ceQ import CEQ
+from game_solvers import CEConstraintBuilder, MinimaxLPSolver, MinimaxSimplexSolver
+
+SEED = 0
+# the cvxopt solvers stop at a tolerance of about 1e-7
+TOLERANCE = 1e-5
+
+# random games and degenerate integer games (k, n, n)
+def sampleGames(number, numActions):
+    rng = np.random.RandomState(SEED)
+    n = numActions
+    games = [rng.normal(size=(number, n, n)),
+             rng.randint(-1, 2, size=(number, n, n)).astype(float),
+             rng.randint(-3, 4, size=(number, n, n)).astype(float),
+             np.zeros((1, n, n)), np.ones((1, n, n)), np.eye(n)[None], -np.eye(n)[None]]
+    duplicated = rng.randint(-1, 2, size=(number, n, n)).astype(float)
+    duplicated[:, :, 1] = duplicated[:, :, 0]
+    duplicated[:, 3] = duplicated[:, 2]
+    games.append(duplicated)
+    return np.concatenate(games)
+
+# the problems of the maximin policies pi (k, n) and values V (k,) of the games, compared to the values reference
+def checkMaximin(name, games, pi, V, reference):
+    problems = []
+    # the payoff pi guarantees whatever the opponent plays, gameMatrix has a row per opponent action
+    guaranteed = np.min(np.einsum('koa,ka->ko', games, pi), axis=1)
+    for i in range(len(games)):
+        if np.any(pi[i] < -TOLERANCE) or abs(pi[i].sum() - 1) > TOLERANCE:
+            problems.append("{}: game {} policy {} is not a distribution".format(name, i, pi[i]))
+        elif abs(V[i] - reference[i]) > TOLERANCE:
+            problems.append("{}: game {} value {} but the LP gives {}".format(name, i, V[i], reference[i]))
+        elif abs(guaranteed[i] - reference[i]) > TOLERANCE:
+            problems.append("{}: game {} policy guarantees {} but the LP value is {}".format(
+                name, i, guaranteed[i], reference[i]))
+    return problems
+
+def validateSolvers(number):
+    numActions = 5
+    games = sampleGames(number, numActions)
+    lp = MinimaxLPSolver(numActions, warmStart=False)
+    solved = [lp.solve(game) for game in games]
+    reference = np.array([V for pi, V in solved])
+    problems = checkMaximin('MinimaxLPSolver.solve', games, np.array([pi for pi, V in solved]), reference, reference)
+    problems += checkMaximin('MinimaxLPSolver.solveMany', games, *lp.solveMany(games), reference)
+    simplex = MinimaxSimplexSolver(numActions)
+    solved = [simplex.solve(game) for game in games]
+    pi, V = np.array([pi for pi, V in solved]), np.array([V for pi, V in solved])
+    problems += checkMaximin('MinimaxSimplexSolver.solve', games, pi, V, reference)
+    piMany, VMany = simplex.solveMany(games)
+    problems += checkMaximin('MinimaxSimplexSolver.solveMany', games, piMany, VMany, reference)
+    # solveMany takes the same pivots as solve
+    for i in np.flatnonzero(np.any(np.abs(piMany - pi) > 1e-9, axis=1) | (np.abs(VMany - V) > 1e-9)):
+        problems.append("MinimaxSimplexSolver.solveMany: game {} gives {}, {} but solve gives {}, {}".format(
+            i, piMany[i], VMany[i], pi[i], V[i]))
+    return problems
+
+# the outputs of reset and step with their types, two enviroments must give the same
+def stepOutputs(env, actions):
+    outputs = [(env.reset(),)]
+    for a, o in actions:
+        outputs.append(env.step(a, o))
+        if outputs[-1][2]:
+            outputs.append((env.reset(),))
+    return [(output, tuple(type(value) for value in output)) for output in outputs]
+
+def validateStep(number):
+    problems = []
+    rng = np.random.RandomState(SEED)
+    for field in (SoccerField(), SoccerField(4, 6)):
+        for seed in range(5):
+            actions = rng.randint(5, size=(number, 2)).tolist()
+            envs = [SoccerEnviroment(useTable, RandomStream(seed), field) for useTable in (False, True)]
+            outputs = [stepOutputs(env, actions) for env in envs]
+            for i, (direct, table) in enumerate(zip(*outputs)):
+                if direct != table:
+                    problems.append("step on {}x{} seed {}: output {} is {} with the table and {} without".format(
+                        field.rows, field.columns, seed, i, table, direct))
+                    break
+            if envs[0].rng.randomMany(4).tolist() != envs[1].rng.randomMany(4).tolist() or \
+                    envs[0].rng.random() != envs[1].rng.random():
+                problems.append("step on {}x{} seed {}: the table draws other random numbers".format(
+                    field.rows, field.columns, seed))
+    return problems
+
+# the LP of the utilitarian correlated equilibrium as CEQ built it with loops, A x >= b maximizing c'x
+def loopCEConstraints(Q, opponentQ):
+    numActions = len(Q)
+    numComActions = numActions**2
+    A = []
+    b = []
+    # first do A
+    for i in range(numActions):
+        for j in range(numActions):
+            if i == j:
+                continue
+            equation = [0]*(numComActions)
+            for k in range(numActions):
+                equation[numActions * i + k] = Q[i, k] - Q[j, k]
+            A.append(equation)
+            b.append(0)
+    # next do B
+    for i in range(numActions):
+        for j in range(numActions):
+            if i == j:
+                continue
+            equation = [0]*(numComActions)
+            for k in range(numActions):
+                equation[numActions * k + i] = opponentQ[k, i] - opponentQ[k, j]
+            A.append(equation)
+            b.append(0)
+    A = np.array(A, dtype=float)
+    b = np.array(b, dtype=float)
+    I = np.zeros((numComActions, numComActions))
+    for i in range(numComActions):
+        I[i, i] = 1
+    A = np.vstack((A, I, [1]*numComActions, [-1]*numComActions))
+    b = np.concatenate((b, [0]*numComActions, [1, -1]))
+    c = []
+    for i in range(numActions):
+        for j in range(numActions):
+            c.append(Q[i, j] + opponentQ[i, j])
+    return A, b, np.array(c)
+
+def validateCE(number):
+    problems = []
+    rng = np.random.RandomState(SEED)
+    for numActions in (5, 3):
+        builder = CEConstraintBuilder(numActions)
+        Q = np.concatenate([rng.normal(size=(number, numActions, numActions)),
+                            rng.randint(-1, 2, size=(number, numActions, numActions)).astype(float)])
+        opponentQ = np.concatenate([rng.normal(size=(number, numActions, numActions)), -Q[number:]])
+        blocks = builder.rationality(Q, opponentQ)
+        for i in range(len(Q)):
+            expected = loopCEConstraints(Q[i], opponentQ[i])
+            built = [matrix.copy() for matrix in builder.build(Q[i], opponentQ[i])]
+            for name, a, b in zip(('A', 'b', 'c'), expected, built):
+                if a.shape != b.shape or not np.array_equal(a, b):
+                    problems.append("ce with {} actions: game {} {} differs from the loops".format(numActions, i, name))
+            if not np.array_equal(blocks[i], expected[0][:builder.numRationality]):
+                problems.append("ce with {} actions: game {} rationality of the stack differs from the loops".format(
+                    numActions, i))
+    return problems
+
+RESUME_AGENTS = {
+    'QLearning': QLearning,
+    'FriendQ': FriendQ,
+    'FoeQ': FoeQ,
+    'FoeQ.lazy': lambda env, gamma: FoeQ(env, gamma, lazy=True, tolerance=0.05, backend='simplex'),
+    'FoeQ.lazy.sparse': lambda env, gamma: FoeQ(env, gamma, lazy=True, tolerance=0.05, backend='simplex', sparse=True),
+    'CEQ.lazy': lambda env, gamma: CEQ(env, gamma, lazy=True, tolerance=0.05),
+}
+
+# the game of a resume check, trained for numEpisode episodes with a checkpoint at path (or without one)
+def trainGame(make, numEpisode, path=None):
+    env = SoccerEnviroment()
+    game = SoccerGame(numEpisode, 1, 0.99, 0.001, 1, 0.99, 0.01, 0.99, env, make(env, 0.99), make(env, 0.99),
+                      seed=SEED, metrics=MetricsSink([ErrorCurve()]))
+    return game, game.train(checkpointPath=path)
+
+def validateResume(number):
+    problems = []
+    numEpisode = max(number // 20, 2)
+    for name, make in RESUME_AGENTS.items():
+        full, fullError = trainGame(make, numEpisode)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'resume.ckpt')
+            trainGame(make, numEpisode // 2, path)
+            resumed, resumedError = trainGame(make, numEpisode, path)
+        if not np.array_equal(fullError, resumedError):
+            problems.append("resume of {}: the error curve differs from the run without checkpoint".format(name))
+        for role in ('agent', 'opponent'):
+            tables = getattr(resumed, role).getTables()
+            for table, expected in getattr(full, role).getTables().items():
+                difference = np.max(np.abs(np.asarray(tables[table]) - np.asarray(expected)))
+                if difference > 0:
+                    problems.append("resume of {}: {} {} differs by up to {} from the run without checkpoint".format(
+                        name, role, table, difference))
+    return problems
+
+VALIDATIONS = {
+    'solvers': validateSolvers,
+    'step': validateStep,
+    'ce': validateCE,
+    'resume': validateResume,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='checks the fast paths of the soccer game against the reference code')
+    parser.add_argument('--only', nargs='*', choices=list(VALIDATIONS), help='run only these checks')
+    parser.add_argument('--number', type=int, default=500, help='cases of each kind a check draws')
+    args = parser.parse_args(argv)
+
+    status = 0
+    for name in args.only or VALIDATIONS:
+        problems = VALIDATIONS[name](args.number)
+        for problem in problems:
+            print(problem)
+        print("{:<12}{}".format(name, "{} problem(s)".format(len(problems)) if problems else 'ok'))
+        status = status or int(bool(problems))
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())